@@ -0,0 +1,377 @@
+# -*- coding: utf-8 -*-
+"""
+    kaijin - offline benchmark harness
+
+    Stand-ins for the request, config, user, formatter and pages of a
+    wiki, so the theme can be rendered and timed without a wiki
+    instance: no wiki config, data directory or server is needed. The
+    MoinMoin package itself must be importable (PYTHONPATH pointing to
+    a MoinMoin source tree is enough), for the MoinMoin modules the
+    theme uses. The theme package is loaded from optional/__init__.py
+    of this tree, and the theme from kaijin.py.
+
+    The stand-ins implement the part of the MoinMoin interfaces used by
+    the theme, and do no I/O themselves. The theme links pages through
+    its own page pool, with MoinMoin pages; only Page.exists is replaced
+    by a lookup in PAGES, see pageExists. Other MoinMoin functions the
+    theme calls directly still look in Config.data_dir, which need not
+    exist. So the timings are lower than on a real wiki, and only
+    comparable with a baseline measured on the same machine with the
+    same MoinMoin, see benchmarks/run.py.
+
+    @license: GNU GPL, see COPYING for details.
+"""
+
+import os, sys, time, imp, tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Page names of the stand-in wiki, every other page does not exist
+PAGES = [u'FrontPage', u'RecentChanges', u'FindPage', u'HelpContents',
+         u'SiteNavigation', u'WikiSandBox', u'MyPage']
+
+# Scenarios: attributes of the user, page and request of a page view.
+#   valid: logged in user
+#   page: name of the page viewed
+#   trail: length of the user page trail
+#   quicklinks: number of user quicklinks
+#   actions: number of custom actions
+#   rc: number of RecentChanges rows
+SCENARIOS = {
+    'anonymous': {'valid': 0},
+    'loggedin': {'valid': 1, 'trail': 5, 'quicklinks': 3},
+    'deep': {'valid': 1, 'trail': 5,
+             'page': u'Projects/Kaijin/Design/Icons/Silk/Notes'},
+    'longtrail': {'valid': 1, 'trail': 30, 'quicklinks': 10},
+    'manyactions': {'valid': 1, 'actions': 40},
+    'largerc': {'valid': 1, 'rc': 3000},
+    }
+
+DEFAULTS = {'valid': 1, 'page': u'FrontPage', 'trail': 0, 'quicklinks': 0,
+            'actions': 3, 'rc': 100}
+
+_modules = []
+
+def pageExists(page, rev=0, domain=None, includeDeleted=0):
+    """ Page.exists of the stand-in wiki: the pages in PAGES exist """
+    return page.page_name in PAGES
+
+def loadTheme():
+    """ Load optional/__init__.py as MoinMoin.theme and kaijin.py
+
+    optional/config.py is loaded first as MoinMoin.config, as the theme
+    package needs it. MoinMoin pages, and so the pages of the theme page
+    pool, exist when they are in PAGES.
+
+    @rtype: tuple
+    @return: theme package module, kaijin module
+    """
+    if not _modules:
+        import MoinMoin
+        MoinMoin.config = imp.load_source(
+            'MoinMoin.config', os.path.join(ROOT, 'optional', 'config.py'))
+        from MoinMoin import i18n
+        if getattr(i18n, 'languages', None) is None:
+            # Loaded from the wiki language files on the first request
+            i18n.languages = {'en': {'x-direction': 'ltr'}}
+        import MoinMoin.Page
+        MoinMoin.Page.Page.exists = pageExists
+        theme = imp.load_source('MoinMoin.theme',
+                                os.path.join(ROOT, 'optional', '__init__.py'))
+        MoinMoin.theme = theme
+        kaijin = imp.load_source('MoinMoin.theme.kaijin',
+                                 os.path.join(ROOT, 'kaijin.py'))
+        _modules.extend([theme, kaijin])
+    return tuple(_modules)
+
+
+class Config:
+    """ The wiki config options used by the theme """
+    siteid = 'benchmark'
+    sitename = u'Benchmark Wiki'
+    interwikiname = u'Benchmark'
+    user_homewiki = 'Self'
+    url_prefix = '/wiki'
+    data_dir = os.path.join(tempfile.gettempdir(), 'kaijin-benchmark')
+    data_underlay_dir = None
+    theme_htdocs_dir = None
+    page_front_page = u'FrontPage'
+    navi_bar = [u'RecentChanges', u'FindPage', u'HelpContents',
+                u'[http://moinmo.in/ MoinMoin]']
+    page_header1 = page_header2 = page_footer1 = page_footer2 = ''
+    page_credits = [
+        '<a href="http://moinmo.in/" title="This site uses the MoinMoin '
+        'Wiki software.">MoinMoin Powered</a>',
+        '<a href="http://moinmo.in/Python" title="MoinMoin is written in '
+        'Python.">Python Powered</a>',
+        ]
+    page_icons_table = {}
+    stylesheets = []
+    hacks = {}
+    logo_string = u''
+    show_interwiki = 0
+    show_version = 0
+    show_login = 1
+    mail_enabled = 1
+    editor_ui = 'freechoice'
+    editor_default = 'text'
+    trail_size = 5
+
+
+class May:
+    """ User rights, everything is allowed """
+
+    def __getattr__(self, right):
+        return lambda pagename: True
+
+
+class User:
+
+    def __init__(self, valid=1, trail=0, quicklinks=0):
+        self.valid = valid
+        self.id = valid and '1200000000.1.1' or ''
+        self.name = valid and u'JoeDoe' or u''
+        self.aliasname = u''
+        self.language = 'en'
+        self.css_url = ''
+        self.editor_ui = '<default>'
+        self.wikiname_add_spaces = 0
+        self.show_page_trail = 1
+        self.tz_offset = 0
+        self.may = May()
+        self._trail = [u'Trail/Page%d' % i for i in range(trail)]
+        self._quicklinks = [u'QuickLink%d' % i for i in range(quicklinks)]
+
+    def getTrail(self):
+        return self._trail
+
+    def getQuickLinks(self):
+        return self._quicklinks
+
+    def isSubscribedTo(self, pagelist):
+        return False
+
+    def isQuickLinkedTo(self, pagelist):
+        return False
+
+
+class Formatter:
+    """ The html formatter methods used by the theme """
+
+    def __init__(self, request):
+        self.request = request
+
+    def _attrs(self, attrs):
+        names = attrs.keys()
+        names.sort()
+        return ''.join([' %s="%s"' % (name, attrs[name]) for name in names
+                        if attrs[name] is not None])
+
+    def text(self, text, **kw):
+        return text.replace('&', '&amp;').replace('<', '&lt;')
+
+    def rawHTML(self, markup):
+        return markup
+
+    def image(self, src=None, **kw):
+        kw['src'] = src
+        return '<img%s>' % self._attrs(kw)
+
+    def url(self, on, url=None, css=None, **kw):
+        if not on:
+            return '</a>'
+        kw['href'] = url
+        kw['class'] = css
+        return '<a%s>' % self._attrs(kw)
+
+    def interwikilink(self, on, interwiki='', pagename='', **kw):
+        if not on:
+            return '</a>'
+        return self.url(1, 'http://example.org/%s/%s' % (interwiki, pagename),
+                        css='interwiki', title=kw.get('title'),
+                        id=kw.get('id'))
+
+
+class Page:
+    """ The page viewed, d['page'] of the theme """
+    pi_format = 'wiki'
+
+    def __init__(self, request, page_name, **kw):
+        self.request = request
+        self.page_name = page_name
+
+    exists = pageExists
+
+    def isWritable(self):
+        return True
+
+    def canUseCache(self):
+        return True
+
+    def lastEditInfo(self, request=None):
+        return {'time': '2008-05-01 12:00:00', 'editor': u'JoeDoe'}
+
+    def split_title(self, request, force=0):
+        return self.page_name
+
+    def url(self, request, querystr=None, anchor=None, **kw):
+        url = '%s/%s' % (request.getScriptname(),
+                         self.page_name.replace(' ', '_'))
+        if isinstance(querystr, dict):
+            querystr = '&amp;'.join(['%s=%s' % item
+                                     for item in querystr.items()])
+        if querystr:
+            url += '?' + querystr
+        if anchor:
+            url += '#' + anchor
+        return url
+
+    def link_to(self, request, text=None, querystr=None, anchor=None, **kw):
+        if text is None:
+            text = self.page_name
+        if not self.exists():
+            kw['css_class'] = 'nonexistent'
+        return '%s%s</a>' % (request.formatter.url(
+            1, self.url(request, querystr, anchor), kw.get('css_class'),
+            **dict([(key, value) for key, value in kw.items()
+                    if key not in ('css_class', 'rel')])), text)
+
+
+class Request:
+
+    def __init__(self, valid=1, trail=0, quicklinks=0, actions=3, **kw):
+        self.cfg = Config()
+        self.user = User(valid, trail, quicklinks)
+        self.lang = self.content_lang = 'en'
+        self.form = {}
+        self.formatter = self.html_formatter = Formatter(self)
+        self.headers = []
+        self.output = []
+        self._actions = {}
+        for name in [u'RenamePage', u'DeletePage', u'LikePages',
+                     u'LocalSiteMap', u'AttachFile', u'SpellCheck']:
+            self._actions[name] = 1
+        for i in range(actions):
+            self._actions[u'CustomAction%02d' % i] = 1
+
+    def getText(self, text, formatted=True):
+        return text
+
+    def getScriptname(self):
+        return '/wiki'
+
+    def getAvailableActions(self, page):
+        return self._actions
+
+    def normalizePagename(self, name):
+        return name.replace('_', ' ').strip('/')
+
+    def setHttpHeader(self, header):
+        self.headers.append(header)
+
+    def write(self, *data):
+        self.output.extend(data)
+
+    def flush(self):
+        pass
+
+
+def scenario(name):
+    """ Return the settings of a scenario, see SCENARIOS """
+    settings = DEFAULTS.copy()
+    settings.update(SCENARIOS[name])
+    return settings
+
+
+def pageView(name, themeClass=None, request=None):
+    """ Create the theme and parameter dict of a page view
+
+    @param name: scenario name
+    @param themeClass: theme class, kaijin.Theme by default
+    @param request: request of the scenario, created by default
+    @rtype: tuple
+    @return: theme, parameter dict
+    """
+    settings = scenario(name)
+    if themeClass is None:
+        themeClass = loadTheme()[1].Theme
+    if request is None:
+        request = Request(**settings)
+    theme = themeClass(request)
+    pagename = settings['page']
+    page = Page(request, pagename)
+    d = {
+        'page': page,
+        'page_name': pagename,
+        'title': pagename,
+        'title_text': pagename,
+        'title_link': page.url(request, 'action=fullsearch&value=linkto'),
+        'sitename': request.cfg.sitename,
+        'print_mode': 0,
+        'media': 'screen',
+        'msg': '',
+        }
+    return theme, d
+
+
+def recentChanges(theme, count):
+    """ Return the parameters of a RecentChanges page
+
+    @param theme: theme rendering the page
+    @param count: number of rows
+    @rtype: tuple
+    @return: header dict, list of (daybreak dict, rows, pagenames) per
+             day, footer dict
+    """
+    header = {
+        'page': Page(theme.request, u'RecentChanges'),
+        'q_page_name': u'RecentChanges',
+        'rc_days': [1, 2, 3, 7, 14, 30, 60, 90],
+        'rc_max_days': 30,
+        'rc_update_bookmark': '',
+        'rc_curr_bookmark': '',
+        }
+    days = []
+    rows = []
+    for i in range(count):
+        if i % 50 == 0:
+            rows = []
+            days.append(({'date': u'2008-%02d-%02d' % (12 - i / 1500,
+                                                      28 - i / 50 % 28),
+                          'bookmark_link_html': ''}, rows, []))
+        changes = i % 4
+        rows.append({
+            'icon_html': u'<a href="/wiki/Page%d?action=diff">'
+                         u'<img src="/wiki/kaijin/img/moin-updated.png" '
+                         u'alt="[UPDATED]"></a>' % i,
+            'pagelink_html': u'<a href="/wiki/Page%d">Page%d</a>' % (i, i),
+            'time_html': i % 3 and u'[%02d:%02d]' % (i % 24, i % 60) or u'',
+            'info_html': u'<a href="/wiki/Page%d?action=info">'
+                         u'<img src="/wiki/kaijin/img/moin-info.png" '
+                         u'alt="[INFO]"></a>' % i,
+            'editors': [u'<span title="Editor%d">Editor%d</span>' % (j, j)
+                        for j in range(changes or 1)],
+            'changecount': changes,
+            'comments': [(j + 1, u'comment %d' % j) for j in range(changes)],
+            })
+        days[-1][2].append(u'Page%d' % i)
+    footer = {'rc_msg': ''}
+    return header, days, footer
+
+
+def best(function, repeat=5, number=1):
+    """ Return the best time of repeated calls of function
+
+    @param function: function to time
+    @param repeat: number of measurements
+    @param number: calls per measurement
+    @rtype: float
+    @return: seconds per call
+    """
+    times = []
+    for i in range(repeat):
+        start = time.time()
+        for j in range(number):
+            function()
+        times.append((time.time() - start) / number)
+    return min(times)
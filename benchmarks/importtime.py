@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+    kaijin - theme package import time benchmark
+
+    Import the theme package and config in new processes, as a CGI or
+    FastCGI worker does on start, and print the import time, and the
+    cost of the work deferred to first use: probing for RSS support.
+    Before, every worker paid for it at import.
+
+    Usage: python benchmarks/importtime.py [repeat]
+
+    Needs MoinMoin, but no wiki, see benchmarks/harness.py.
+
+    @license: GNU GPL, see COPYING for details.
+"""
+
+import os, sys
+
+CHILD = """
+import sys, time
+sys.path.insert(0, %r)
+import harness
+start = time.time()
+theme = harness.loadTheme()[0]
+from MoinMoin import config
+loaded = time.time()
+theme.rssSupported()
+sys.stdout.write('%%f %%f' %% (loaded - start, time.time() - loaded))
+"""
+
+
+def importTimes(repeat):
+    """ Return the best times of repeat new processes
+
+    @param repeat: number of processes
+    @rtype: tuple
+    @return: seconds to import, seconds to probe RSS
+    """
+    code = CHILD % os.path.dirname(os.path.abspath(__file__))
+    results = []
+    for i in range(repeat):
+        f = os.popen('%s -c "%s"' % (sys.executable,
+                                     code.replace('"', '\\"')))
+        try:
+            results.append([float(field) for field in f.read().split()])
+        finally:
+            f.close()
+    return [min([result[i] for result in results]) for i in range(2)]
+
+
+def main(repeat=20):
+    imported, probes = importTimes(repeat)
+    print 'best of %d processes' % repeat
+    print 'import:              %8.2f ms' % (imported * 1000)
+    print 'deferred RSS probe:  %8.2f ms' % (probes * 1000)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+    kaijin - page name validation benchmark
+
+    Check the same page names one regex search per name with
+    config.page_invalid_chars_regex, and with one
+    config.invalid_pagenames call, and print the names per second of
+    both.
+
+    Usage: python benchmarks/pagenames.py [names] [repeat]
+
+    Needs MoinMoin, but no wiki, see benchmarks/harness.py.
+
+    @license: GNU GPL, see COPYING for details.
+"""
+
+import sys, random
+
+import harness
+
+
+def makeNames(count):
+    """ Return count page names, one in a hundred invalid """
+    random.seed(count)
+    invalid = u'\u0000‪‫‬‭‮'
+    names = []
+    for i in range(count):
+        name = u'Projects/Kaijin%d/Page%d\xe4中' % (i % 97, i)
+        if i % 100 == 0:
+            position = random.randint(0, len(name))
+            name = name[:position] + random.choice(invalid) + name[position:]
+        names.append(name)
+    return names
+
+
+def perName(config, names):
+    """ The names found invalid by a regex search per name """
+    search = config.page_invalid_chars_regex.search
+    result = []
+    for index in range(len(names)):
+        match = search(names[index])
+        if match:
+            result.append((index, match.start()))
+    return result
+
+
+def main(count=50000, repeat=5):
+    harness.loadTheme()
+    from MoinMoin import config
+    names = makeNames(count)
+    if perName(config, names) != config.invalid_pagenames(names):
+        print 'invalid_pagenames differs from page_invalid_chars_regex'
+        sys.exit(1)
+
+    single = harness.best(lambda: perName(config, names), repeat)
+    bulk = harness.best(lambda: config.invalid_pagenames(names), repeat)
+    print 'names: %d, best of %d' % (count, repeat)
+    print 'per name:   %10.0f names/s' % (count / single)
+    print 'bulk:       %10.0f names/s' % (count / bulk)
+    print 'speedup:    %10.2fx' % (single / bulk)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
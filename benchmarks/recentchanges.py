@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+    kaijin - RecentChanges row rendering benchmark
+
+    Render the same RecentChanges rows one call per row, the way the
+    theme did before ThemeBase.recentchanges_entries, and with one
+    recentchanges_entries call, and print the rows per second of both.
+
+    Usage: python benchmarks/recentchanges.py [rows] [repeat]
+
+    Needs MoinMoin, but no wiki, see benchmarks/harness.py.
+
+    @license: GNU GPL, see COPYING for details.
+"""
+
+import sys
+
+import harness
+
+
+def legacy_entry(d):
+    """ recentchanges_entry as it was before the row template """
+    html = []
+    html.append('<tr>\n')
+    html.append('<td class="rcicon1">%(icon_html)s</td>\n' % d)
+    html.append('<td class="rcpagelink">%(pagelink_html)s</td>\n' % d)
+    html.append('<td class="rctime">')
+    if d['time_html']:
+        html.append("%(time_html)s" % d)
+    html.append('</td>\n')
+    html.append('<td class="rcicon2">%(info_html)s</td>\n' % d)
+    html.append('<td class="rceditor">')
+    if d['editors']:
+        html.append('<br>'.join(d['editors']))
+    html.append('</td>\n')
+    html.append('<td class="rccomment">')
+    if d['comments']:
+        if d['changecount'] > 1:
+            notfirst = 0
+            for comment in d['comments']:
+                html.append('%s<tt>#%02d</tt>&nbsp;%s' % (
+                    notfirst and '<br>' or '' , comment[0], comment[1]))
+                notfirst = 1
+        else:
+            comment = d['comments'][0]
+            html.append('%s' % comment[1])
+    html.append('</td>\n')
+    html.append('</tr>\n')
+    return ''.join(html)
+
+
+def main(count=3000, repeat=10):
+    theme, d = harness.pageView('loggedin', harness.loadTheme()[0].ThemeBase)
+    rows = []
+    for daybreak, dayrows, pagenames in harness.recentChanges(theme, count)[1]:
+        rows.extend(dayrows)
+    if ''.join(map(legacy_entry, rows)) != theme.recentchanges_entries(rows):
+        print 'recentchanges_entries output differs from the per row output'
+        sys.exit(1)
+
+    legacy = harness.best(lambda: ''.join([legacy_entry(d) for d in rows]),
+                          repeat)
+    batch = harness.best(lambda: theme.recentchanges_entries(rows), repeat)
+    print 'rows: %d, best of %d' % (count, repeat)
+    print 'per row:    %10.0f rows/s' % (count / legacy)
+    print 'batch:      %10.0f rows/s' % (count / batch)
+    print 'speedup:    %10.2fx' % (legacy / batch)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+    kaijin - theme rendering benchmarks
+
+    Time the theme methods rendering a page view in the scenarios of
+    benchmarks/harness.py, and compare the times with a baseline
+    measured on the same machine, with the same MoinMoin.
+
+    Usage: python benchmarks/run.py [options] [benchmark...]
+
+    Options:
+        -b file     baseline file, default benchmarks/baseline.txt
+        -w          write the times to the baseline file, e.g. before
+                    upgrading or changing the theme
+        -t file     thresholds file, default benchmarks/thresholds.txt
+        -r repeat   number of measurements, the best is used (default 5)
+        -n number   page views per measurement (default 20)
+
+    Prints one tab separated record per benchmark and scenario:
+
+        benchmark  scenario  usec  baseline  ratio  status
+
+    usec is the time per page view in microseconds, including the
+    creation of the theme, and ratio is usec divided by the baseline
+    time. status is "ok", "slow" when the ratio is over the threshold,
+    or "-" without a baseline. The exit status is 1 if any benchmark is
+    slow, so the script can gate upgrades.
+
+    Needs MoinMoin, but no wiki, see benchmarks/harness.py.
+
+    @license: GNU GPL, see COPYING for details.
+"""
+
+import os, sys, time, getopt
+
+import harness
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASELINE = os.path.join(HERE, 'baseline.txt')
+THRESHOLDS = os.path.join(HERE, 'thresholds.txt')
+
+PAGE_SCENARIOS = ('anonymous', 'loggedin', 'deep', 'longtrail', 'manyactions')
+RC_SCENARIOS = ('loggedin', 'largerc')
+
+
+def recentchanges(theme, d, rc):
+    header, days, footer = rc
+    html = [theme.recentchanges_header(header)]
+    for i in range(len(days)):
+        daybreak, rows, pagenames = days[i]
+        if i == 0:
+            # The current day is never cached
+            pagenames = None
+        html.append(theme.recentchanges_day(daybreak, rows, pagenames))
+    html.append(theme.recentchanges_footer(footer))
+    return ''.join(html)
+
+# name, function, scenarios
+BENCHMARKS = (
+    ('header', lambda theme, d, rc: theme.header(d), PAGE_SCENARIOS),
+    ('editorheader', lambda theme, d, rc: theme.editorheader(d),
+     PAGE_SCENARIOS),
+    ('footer', lambda theme, d, rc: theme.footer(d), PAGE_SCENARIOS),
+    ('html_head', lambda theme, d, rc: theme.html_head(d), PAGE_SCENARIOS),
+    ('navibar', lambda theme, d, rc: theme.navibar(d), PAGE_SCENARIOS),
+    ('actionsMenu', lambda theme, d, rc: theme.actionsMenu(d['page']),
+     PAGE_SCENARIOS),
+    ('recentchanges', recentchanges, RC_SCENARIOS),
+    )
+
+
+def readRecords(filename):
+    """ Read a baseline or thresholds file
+
+    Each line is a record "benchmark scenario value".
+
+    @param filename: file name
+    @rtype: dict
+    @return: (benchmark, scenario) -> value
+    """
+    records = {}
+    try:
+        f = file(filename)
+    except IOError:
+        return records
+    try:
+        for line in f:
+            fields = line.split()
+            if len(fields) != 3 or fields[0].startswith('#'):
+                continue
+            records[(fields[0], fields[1])] = float(fields[2])
+    finally:
+        f.close()
+    return records
+
+
+def writeBaseline(filename, times):
+    """ Write a baseline file, see readRecords
+
+    @param filename: file name
+    @param times: list of (benchmark, scenario, usec)
+    """
+    f = file(filename, 'w')
+    try:
+        f.write('# Written by benchmarks/run.py -w\n')
+        for record in times:
+            f.write('%s\t%s\t%.0f\n' % record)
+    finally:
+        f.close()
+
+
+def threshold(thresholds, name, scenario):
+    """ Return the allowed ratio to the baseline of a benchmark
+
+    "*" in the thresholds file matches any benchmark or scenario.
+    """
+    for key in ((name, scenario), (name, '*'), ('*', '*')):
+        if key in thresholds:
+            return thresholds[key]
+    return None
+
+
+def measure(function, name, repeat, number):
+    """ Return the best time per page view of a benchmark in a scenario
+
+    @param function: benchmark function
+    @param name: scenario name
+    @param repeat: number of measurements
+    @param number: page views per measurement
+    @rtype: float
+    @return: seconds per page view
+    """
+    settings = harness.scenario(name)
+    # Fill the caches shared between requests, as on a running wiki
+    theme, d = harness.pageView(name)
+    rc = harness.recentChanges(theme, settings['rc'])
+    function(theme, d, rc)
+    times = []
+    for i in range(repeat):
+        requests = [harness.Request(**settings) for j in range(number)]
+        start = time.time()
+        for request in requests:
+            theme, d = harness.pageView(name, request=request)
+            function(theme, d, rc)
+        times.append((time.time() - start) / number)
+    return min(times)
+
+
+def main(args):
+    opts, names = getopt.getopt(args, 'b:wt:r:n:')
+    opts = dict(opts)
+    baselineFile = opts.get('-b', BASELINE)
+    baseline = readRecords(baselineFile)
+    thresholds = readRecords(opts.get('-t', THRESHOLDS))
+    repeat = int(opts.get('-r', 5))
+    number = int(opts.get('-n', 20))
+
+    slow = 0
+    times = []
+    for name, function, scenarios in BENCHMARKS:
+        if names and name not in names:
+            continue
+        for scenario in scenarios:
+            usec = measure(function, scenario, repeat, number) * 1e6
+            times.append((name, scenario, usec))
+            base = baseline.get((name, scenario))
+            limit = threshold(thresholds, name, scenario)
+            if not base:
+                base, ratio, status = '-', '-', '-'
+            else:
+                ratio = usec / base
+                status = 'ok'
+                if limit is not None and ratio > limit:
+                    status = 'slow'
+                    slow = 1
+                base, ratio = '%.0f' % base, '%.2f' % ratio
+            print '\t'.join([name, scenario, '%.0f' % usec, base, ratio,
+                             status])
+            sys.stdout.flush()
+    if '-w' in opts:
+        if names:
+            # Keep the baseline of the benchmarks not run
+            for key, usec in baseline.items():
+                if key[0] not in names:
+                    times.append(key + (usec,))
+            times.sort()
+        writeBaseline(baselineFile, times)
+    return slow
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -8,10 +8,145 @@
 
 from MoinMoin.theme import ThemeBase
 
+
+class Skeleton:
+    """ Page layout compiled into a template with named slots
+
+    A layout is a sequence of static markup and slot names, written as
+    1-tuples. The static markup is joined once per process, when the
+    theme is imported; rendering calls only the slot functions and fills
+    one format string.
+    """
+
+    def __init__(self, *layout):
+        self.slots = []
+        parts = []
+        for item in layout:
+            if isinstance(item, tuple):
+                self.slots.append(item[0])
+                parts.append(u'%%(%s)s' % item[0])
+            else:
+                parts.append(item.replace(u'%', u'%%'))
+        self.template = u'\n'.join(parts)
+
+        # The same layout as (static markup, slot name) pairs, for stream
+        self.chunks = []
+        markup = sep = u''
+        for item in layout:
+            if isinstance(item, tuple):
+                self.chunks.append((markup + sep, item[0]))
+                markup = u''
+            else:
+                markup += sep + item
+            sep = u'\n'
+        self.tail = markup
+
+    def render(self, slots):
+        """ Render the layout
+
+        Slot functions are called in layout order.
+
+        @param slots: dict mapping slot names to functions returning html
+        @rtype: unicode
+        @return: rendered html
+        """
+        values = {}
+        for name in self.slots:
+            values[name] = slots[name]()
+        return self.template % values
+
+    def stream(self, slots):
+        """ Render the layout in chunks
+
+        Static markup is yielded as soon as it is reached, and each slot
+        as soon as its function returns, so a server can flush the
+        chunks to the client while later slots are still being computed.
+        u''.join(stream(slots)) is equal to render(slots).
+
+        @param slots: dict mapping slot names to functions returning html
+        @rtype: generator
+        @return: html chunks, in layout order
+        """
+        for markup, name in self.chunks:
+            if markup:
+                yield markup
+            yield slots[name]()
+        if self.tail:
+            yield self.tail
+
+
 class Theme(ThemeBase):
 
     name = "kaijin"
 
+    header_skeleton = Skeleton(
+        # Pre header custom html
+        ('page_header1',),
+
+        u'<div id="container">',
+        # Header
+        u'<div id="header">',
+        ## ('logo',),
+
+        ('navibar',),
+
+        ('searchform',),
+        ('username',),
+        u'<div id="locationline">',
+        ('interwiki',),
+        ('title',),
+        u'</div>',
+        ('trail',),
+        #u'<hr id="pageline">',
+        u'<div id="pageline"><hr style="display:none;"></div>',
+        ('msg',),
+        ('editbar',),
+        u'</div>',
+
+        # Post header custom html (not recommended)
+        ('page_header2',),
+
+        # Start of page
+        ('startPage',),
+        )
+
+    editorheader_skeleton = Skeleton(
+        # Pre header custom html
+        ('page_header1',),
+
+        # Header
+        u'<div id="header">',
+        ('title',),
+        ('msg',),
+        u'</div>',
+
+        # Post header custom html (not recommended)
+        ('page_header2',),
+
+        # Start of page
+        ('startPage',),
+        )
+
+    footer_skeleton = Skeleton(
+        # End of page
+        ('pageinfo',),
+        ('endPage',),
+
+        # Pre footer custom html (not recommended!)
+        ('page_footer1',),
+
+        # Footer
+        u'<div id="footer">',
+        ('editbar',),
+        ('credits',),
+        ('showversion',),
+        u'</div>',
+        u'</div>',
+
+        # Post footer custom html
+        ('page_footer2',),
+        )
+
     def header(self, d, **kw):
         """ Assemble wiki header
         
@@ -19,38 +154,10 @@ class Theme(ThemeBase):
         @rtype: unicode
         @return: page header html
         """
-        html = [
-            # Pre header custom html
-            self.emit_custom_html(self.cfg.page_header1),
-            
-            u'<div id="container">',
-            # Header
-            u'<div id="header">',
-            ## self.logo(),
-            
-            self.navibar(d),
-            
-            self.searchform(d),
-            self.username(d),
-            u'<div id="locationline">',
-            self.interwiki(d),
-            self.title(d),
-            u'</div>',
-            self.trail(d),
-            #u'<hr id="pageline">',
-            u'<div id="pageline"><hr style="display:none;"></div>',
-            self.msg(d),
-            self.editbar(d),
-            u'</div>',
-            
-            # Post header custom html (not recommended)
-            self.emit_custom_html(self.cfg.page_header2),
-            
-            # Start of page
-            self.startPage(),
-            
-        ]
-        return u'\n'.join(html)
+        slots = self.timedSlots(self.headerSlots(d), 'header')
+        html = self.header_skeleton.render(slots)
+        self.startBodyTiming()
+        return html
 
     def editorheader(self, d, **kw):
         """ Assemble wiki header for editor
@@ -59,53 +166,178 @@ class Theme(ThemeBase):
         @rtype: unicode
         @return: page header html
         """
-        html = [
-            # Pre header custom html
-            self.emit_custom_html(self.cfg.page_header1),
-            
-            # Header
-            u'<div id="header">',
-            self.title(d),
-            self.msg(d),
-            u'</div>',
-            
-            # Post header custom html (not recommended)
-            self.emit_custom_html(self.cfg.page_header2),
-            
-            # Start of page
-            self.startPage(),
-        ]
-        return u'\n'.join(html)
+        slots = self.timedSlots(self.headerSlots(d), 'editorheader')
+        html = self.editorheader_skeleton.render(slots)
+        self.startBodyTiming()
+        return html
 
     def footer(self, d, **keywords):
         """ Assemble wiki footer
+
+        With fragment timing enabled, the timings of the page are added
+        as html comment after the footer.
         
         @param d: parameter dictionary
         @keyword ...:...
         @rtype: unicode
         @return: page footer html
         """
+        timer = self.timer()
+        if timer:
+            timer.stop('body')
+        slots = self.timedSlots(self.footerSlots(d, **keywords), 'footer')
+        html = self.footer_skeleton.render(slots)
+        if timer:
+            html += timer.report(self.request)
+        return html
+
+    def headscript(self, d):
+        """ Return html head script with common functions
+
+        The functions are in js/headscript.js in the kaijin htdocs
+        directory, so browsers cache them; the page sets only the
+        localized search hint. When tools/fingerprint.py listed the
+        script in the theme manifest, the page links the content hashed
+        file, which can be cached for a long time. Without the theme
+        package of this theme, the functions are inlined as before.
+
+        @param d: parameter dictionary
+        @rtype: unicode
+        @return: script for html head
+        """
+        if not hasattr(self, 'asset_url'):
+            return ThemeBase.headscript(self, d)
+        # Don't add script for print view
+        if self.request.form.get('action', [''])[0] == 'print':
+            return u''
+
+        _ = self.request.getText
+        hint = _('Search', formatted=False)
+        hint = (hint.replace('\\', '\\\\').replace('"', '\\"')
+                .replace('</', '<\\/'))
+        path = '%s/js/headscript.js' % self.name
+        return u"""
+<script type="text/javascript">var search_hint = "%s";</script>
+<script type="text/javascript" src="%s"></script>
+""" % (hint, self.asset_url(path))
+
+    def header_chunks(self, d, **kw):
+        """ Assemble wiki header in chunks, see Skeleton.stream
+
+        MoinMoin sends the header returned by header itself; this is an
+        opt-in API for a server or action that flushes the page while it
+        is rendered, e.g. request.theme.send_chunks(theme.header_chunks(d)).
+
+        @param d: parameter dictionary
+        @rtype: generator
+        @return: page header html chunks
+        """
+        slots = self.timedSlots(self.headerSlots(d), 'header')
+        for chunk in self.header_skeleton.stream(slots):
+            yield chunk
+        self.startBodyTiming()
+
+    def editorheader_chunks(self, d, **kw):
+        """ Assemble wiki header for editor in chunks
+
+        @param d: parameter dictionary
+        @rtype: generator
+        @return: page header html chunks
+        """
+        slots = self.timedSlots(self.headerSlots(d), 'editorheader')
+        for chunk in self.editorheader_skeleton.stream(slots):
+            yield chunk
+        self.startBodyTiming()
+
+    def footer_chunks(self, d, **keywords):
+        """ Assemble wiki footer in chunks
+
+        With fragment timing enabled, the timings of the page are added
+        as html comment after the footer.
+
+        @param d: parameter dictionary
+        @keyword ...:...
+        @rtype: generator
+        @return: page footer html chunks
+        """
+        timer = self.timer()
+        if timer:
+            timer.stop('body')
+        slots = self.timedSlots(self.footerSlots(d, **keywords), 'footer')
+        for chunk in self.footer_skeleton.stream(slots):
+            yield chunk
+        if timer:
+            yield timer.report(self.request)
+
+    def timer(self):
+        """ Return the fragment timer of the request, or None
+
+        Fragment timing (cfg.theme_timing) needs the theme package
+        shipped with this theme, see ThemeBase.fragmentTimer.
+        """
+        fragmentTimer = getattr(self, 'fragmentTimer', None)
+        return fragmentTimer and fragmentTimer()
+
+    def timedSlots(self, slots, prefix):
+        """ Return slot functions, timed if fragment timing is enabled
+
+        @param slots: dict mapping slot names to functions
+        @param prefix: prefix of the timing names
+        @rtype: dict
+        @return: slot name -> function
+        """
+        timer = self.timer()
+        if timer:
+            slots = timer.wrapSlots(slots, prefix)
+        return slots
+
+    def startBodyTiming(self):
+        """ Start timing the page body, ended by the footer """
+        timer = self.timer()
+        if timer:
+            timer.start('body')
+
+    def headerSlots(self, d):
+        """ Return the slot functions of the header skeletons
+        
+        @param d: parameter dictionary
+        @rtype: dict
+        @return: slot name -> function returning the slot html
+        """
+        cfg = self.cfg
+        return {
+            'page_header1': lambda: self.emit_custom_html(cfg.page_header1),
+            'navibar': lambda: self.navibar(d),
+            'searchform': lambda: self.searchform(d),
+            'username': lambda: self.username(d),
+            'interwiki': lambda: self.interwiki(d),
+            'title': lambda: self.title(d),
+            'trail': lambda: self.trail(d),
+            'msg': lambda: self.msg(d),
+            'editbar': lambda: self.editbar(d),
+            'page_header2': lambda: self.emit_custom_html(cfg.page_header2),
+            'startPage': self.startPage,
+            }
+
+    def footerSlots(self, d, **keywords):
+        """ Return the slot functions of the footer skeleton
+        
+        @param d: parameter dictionary
+        @keyword ...:...
+        @rtype: dict
+        @return: slot name -> function returning the slot html
+        """
+        cfg = self.cfg
         page = d['page']
-        html = [
-            # End of page
-            self.pageinfo(page),
-            self.endPage(),
-            
-            # Pre footer custom html (not recommended!)
-            self.emit_custom_html(self.cfg.page_footer1),
-            
-            # Footer
-            u'<div id="footer">',
-            self.editbar(d),
-            self.credits(d),
-            self.showversion(d, **keywords),
-            u'</div>',
-            u'</div>',
-            
-            # Post footer custom html
-            self.emit_custom_html(self.cfg.page_footer2),
-            ]
-        return u'\n'.join(html)
+        return {
+            'pageinfo': lambda: self.pageinfo(page),
+            'endPage': self.endPage,
+            'page_footer1': lambda: self.emit_custom_html(cfg.page_footer1),
+            'editbar': lambda: self.editbar(d),
+            'credits': lambda: self.credits(d),
+            'showversion': lambda: self.showversion(d, **keywords),
+            'page_footer2': lambda: self.emit_custom_html(cfg.page_footer2),
+            }
 
         
 def execute(request):
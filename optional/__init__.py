@@ -6,16 +6,710 @@
     @license: GNU GPL, see COPYING for details.
 """
 
+import os, sys, time, marshal, tempfile
+
+try:
+    from hashlib import md5
+except ImportError:
+    from md5 import new as md5
+
+try:
+    from threading import Lock
+except ImportError:
+    from dummy_threading import Lock
+
 from MoinMoin import i18n, wikiutil, config, version
 from MoinMoin.Page import Page
 from MoinMoin.util import pysupport
 
 modules = pysupport.getPackageModules(__file__)
 
-# Check whether we can emit a RSS feed (code stolen from wikitest.py).
-# Currently RSS is broken on plain Python, and works only when installing PyXML.
-import xml
-rss_supported = '_xmlplus' in xml.__file__
+# RSS support is probed on first use, not when the package is imported
+_probes = {}
+
+def rssSupported():
+    """ Return whether we can emit a RSS feed, probed on first use """
+    try:
+        return _probes['rss_supported']
+    except KeyError:
+        pass
+    # Check whether we can emit a RSS feed (code stolen from wikitest.py).
+    # Currently RSS is broken on plain Python, and works only when installing PyXML.
+    import xml
+    supported = _probes['rss_supported'] = '_xmlplus' in xml.__file__
+    return supported
+
+
+class FragmentCache:
+    """ Size bounded cache for rendered theme fragments
+
+    One cache is shared by all requests served by the process. Keys
+    must contain everything the cached value depends on. When the cache
+    is full it is emptied and refilled on demand, which is cheap and
+    keeps memory bounded without any bookkeeping on each hit.
+    """
+
+    def __init__(self, maxsize=1000):
+        self.maxsize = maxsize
+        self._data = {}
+
+    def get(self, key, default=None):
+        return self._data.get(key, default)
+
+    def set(self, key, value):
+        if len(self._data) >= self.maxsize:
+            self._data.clear()
+        self._data[key] = value
+
+    def clear(self):
+        self._data.clear()
+
+fragment_cache = FragmentCache()
+
+
+class FileFragmentCache:
+    """ Fragment cache shared by all processes of a host, kept in files
+
+    Each value is kept in its own file, named by a hash of its key, in
+    a directory all worker processes can write. Files are written to a
+    temporary file and renamed, so readers never see partial files.
+    Values must be marshallable; others are cached in the process only.
+
+    A value never changes for a key, as keys contain everything the
+    value depends on. So values read once are kept in a FragmentCache
+    of the process too, and TTL and size limits only keep the directory
+    small: expired files are removed, and the oldest files when there
+    are more than maxfiles. A new version ignores all older files.
+    """
+
+    # Change when the format of the cached values changes
+    format = 1
+
+    def __init__(self, directory, ttl=86400, maxfiles=5000, version=''):
+        self.directory = directory
+        self.ttl = ttl
+        self.maxfiles = maxfiles
+        self.version = '%s-%s' % (self.format, version)
+        self._memory = FragmentCache()
+        self._writes = 0
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                pass
+
+    def _filename(self, key):
+        return os.path.join(self.directory, md5(repr(key)).hexdigest())
+
+    def get(self, key, default=None):
+        value = self._memory.get(key, self)
+        if value is not self:
+            return value
+        try:
+            f = open(self._filename(key), 'rb')
+            try:
+                version, expires, keyrepr, value = marshal.load(f)
+            finally:
+                f.close()
+        except (IOError, OSError, EOFError, ValueError, TypeError):
+            return default
+        if (version != self.version or expires < time.time() or
+            keyrepr != repr(key)):
+            return default
+        self._memory.set(key, value)
+        return value
+
+    def set(self, key, value):
+        self._memory.set(key, value)
+        try:
+            data = marshal.dumps((self.version, time.time() + self.ttl,
+                                  repr(key), value))
+        except ValueError:
+            return
+        filename = self._filename(key)
+        try:
+            fd, tmpname = tempfile.mkstemp('.tmp', '', self.directory)
+            try:
+                os.write(fd, data)
+            finally:
+                os.close(fd)
+            try:
+                os.rename(tmpname, filename)
+            except OSError:
+                # Windows does not rename over existing files
+                os.remove(filename)
+                os.rename(tmpname, filename)
+        except (IOError, OSError):
+            return
+        self._writes += 1
+        if self._writes % 100 == 0:
+            self.prune()
+
+    def prune(self):
+        """ Remove expired files, and the oldest if there are too many """
+        now = time.time()
+        files = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                mtime = os.path.getmtime(path)
+                if mtime + self.ttl < now:
+                    os.remove(path)
+                else:
+                    files.append((mtime, path))
+            except OSError:
+                pass
+        if len(files) > self.maxfiles:
+            files.sort()
+            for mtime, path in files[:len(files) - self.maxfiles]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def clear(self):
+        self._memory.clear()
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+# File fragment caches by directory and settings
+_file_caches = {}
+
+
+def configKey(cfg):
+    """ Return a key identifying a wiki config
+
+    The key contains the modification time of the config, so html
+    cached for a config is not used after the config was changed and
+    reloaded. MoinMoin records it in cfg.cfg_mtime, the latest of the
+    wiki config and farmconfig.py; without it, the modification time
+    of the module defining the config is used. The key is computed once
+    and kept on the config object.
+
+    @param cfg: wiki config
+    @rtype: tuple
+    @return: site id and config modification time
+    """
+    try:
+        return cfg._theme_config_key
+    except AttributeError:
+        pass
+    mtime = getattr(cfg, 'cfg_mtime', None) or 0
+    module = sys.modules.get(cfg.__class__.__module__)
+    filename = getattr(module, '__file__', None)
+    if not mtime and filename:
+        try:
+            mtime = os.path.getmtime(filename)
+        except OSError:
+            pass
+    key = (cfg.siteid, mtime)
+    cfg._theme_config_key = key
+    return key
+
+
+_theme_versions = {}
+
+def themeVersion(cls):
+    """ Return a version of a theme class
+
+    The modification times of the modules defining the class and its
+    base classes, so a changed theme gets a new version. It is computed
+    once per class.
+
+    @param cls: theme class
+    @rtype: tuple
+    @return: module modification times
+    """
+    try:
+        return _theme_versions[cls]
+    except KeyError:
+        pass
+    mtimes = []
+    classes = [cls]
+    while classes:
+        klass = classes.pop(0)
+        classes.extend(klass.__bases__)
+        module = sys.modules.get(klass.__module__)
+        filename = getattr(module, '__file__', None)
+        if filename:
+            try:
+                mtimes.append(os.path.getmtime(filename))
+            except OSError:
+                pass
+    version = _theme_versions[cls] = tuple(mtimes)
+    return version
+
+
+_manifests = {}
+
+def loadManifest(filename):
+    """ Return a theme asset manifest, loaded once per process
+
+    The manifest is written by the build tools shipped with the theme.
+    Each line is a record "kind name value...". A missing manifest is
+    an empty one, and themes use their raw asset files.
+
+    @param filename: manifest file name
+    @rtype: dict
+    @return: kind -> {name: tuple of values}
+    """
+    try:
+        return _manifests[filename]
+    except KeyError:
+        pass
+    manifest = {}
+    try:
+        _manifest_mtimes[filename] = os.path.getmtime(filename)
+        f = file(filename)
+        try:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 2 or fields[0].startswith('#'):
+                    continue
+                manifest.setdefault(fields[0], {})[fields[1]] = tuple(fields[2:])
+        finally:
+            f.close()
+    except (IOError, OSError):
+        pass
+    _manifests[filename] = manifest
+    return manifest
+
+# Modification times of the loaded manifests, see ThemeBase.assetVersion
+_manifest_mtimes = {}
+
+
+def editlogFilename(cfg):
+    """ Return the file name of the global edit log of a wiki """
+    return os.path.join(cfg.data_dir, 'edit-log')
+
+
+class EditLogIndex:
+    """ Base class for shared indexes following the global edit log
+
+    sync reads the entries appended to the edit log since the last sync
+    and passes the names of the pages they change to changed. A replaced
+    or truncated edit log calls reset instead, as any page may have
+    changed. Sub classes override both.
+
+    An index is shared by all threads of the process. Sub classes hold
+    self._lock while reading or changing their data; reset and changed
+    are called with the lock held.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._stamp = None
+        self._offset = 0 # edit log position read up to
+
+    def reset(self):
+        """ Forget everything indexed
+
+        Default behavior is to do nothing, for indexes without data.
+        """
+        pass
+
+    def changed(self, pagenames):
+        """ Forget what is indexed for some pages
+
+        Default behavior is to reset the index.
+
+        @param pagenames: list of page names
+        """
+        self.reset()
+
+    def sync(self, filename, stamp):
+        """ Forget the pages changed since the last sync
+
+        @param filename: edit log file name
+        @param stamp: edit log stamp, see ThemeBase.editlogStamp
+        """
+        if stamp == self._stamp:
+            return
+        self._lock.acquire()
+        try:
+            self._sync(filename, stamp)
+        finally:
+            self._lock.release()
+
+    def _sync(self, filename, stamp):
+        if stamp == self._stamp:
+            # Synced by another thread
+            return
+        old, self._stamp = self._stamp, stamp
+        if not (old and stamp and old[0] == stamp[0] and
+                stamp[1] >= self._offset):
+            self.reset()
+            self._offset = stamp and stamp[1] or 0
+            return
+        try:
+            f = open(filename, 'rb')
+            try:
+                f.seek(self._offset)
+                data = f.read(stamp[1] - self._offset)
+            finally:
+                f.close()
+        except IOError:
+            self.reset()
+            return
+        # Leave a partly written last line for the next sync
+        end = data.rfind('\n') + 1
+        self._offset += end
+        names = []
+        for line in data[:end].splitlines():
+            # time, rev, action, pagename, addr, host, userid, extra, comment
+            fields = line.split('\t')
+            if len(fields) < 8 or fields[2].startswith('ATT'):
+                continue
+            try:
+                names.append(wikiutil.unquoteWikiname(fields[3]))
+            except (wikiutil.InvalidFileNameError, UnicodeError):
+                # A broken line, not worth failing the request
+                continue
+            if fields[2] == 'SAVE/RENAME':
+                # The old name of a renamed page is not quoted
+                names.append(unicode(fields[7], 'utf-8', 'replace'))
+        if names:
+            self.changed(names)
+
+
+class PageHierarchy(EditLogIndex):
+    """ Shared index of rendered breadcrumb items
+
+    Maps page names to the rendered breadcrumb item linking them, so
+    the ancestors of a deep sub page are looked up instead of linked
+    one by one. Creating, renaming or deleting a page changes its link,
+    so the index drops the pages named in new edit log entries.
+    """
+
+    def __init__(self, maxsize=5000):
+        EditLogIndex.__init__(self)
+        self.maxsize = maxsize
+        self._items = {}
+
+    def reset(self):
+        self._items = {}
+
+    def changed(self, pagenames):
+        for name in pagenames:
+            try:
+                del self._items[name]
+            except KeyError:
+                pass
+
+    def ancestors(self, theme, segments):
+        """ Return the breadcrumb items of the ancestors of a page
+
+        @param theme: the theme rendering the breadcrumbs
+        @param segments: page name split on '/'
+        @rtype: list
+        @return: rendered items, from the top level page down
+        """
+        items = []
+        curpage = ''
+        for s in segments[:-1]:
+            curpage += s
+            self._lock.acquire()
+            try:
+                item = self._items.get(curpage)
+            finally:
+                self._lock.release()
+            if item is None:
+                link = theme.pages.get(curpage).link_to(theme.request, s)
+                item = "<li>%s</li>" % link
+                self._lock.acquire()
+                try:
+                    if len(self._items) >= self.maxsize:
+                        self._items = {}
+                    self._items[curpage] = item
+                finally:
+                    self._lock.release()
+            items.append(item)
+            curpage += '/'
+        return items
+
+# Breadcrumb indexes by theme, config and script name
+_hierarchies = {}
+
+
+class RecentChangesDays(EditLogIndex):
+    """ Shared cache of rendered RecentChanges day blocks
+
+    Completed days do not get new edit log entries, but their rows show
+    whether a page still exists, so a block is dropped when one of its
+    pages is named in a new edit log entry, and all blocks are dropped
+    when the edit log is rewritten, e.g. by Despam or DeletePage.
+    """
+
+    def __init__(self, maxsize=500):
+        EditLogIndex.__init__(self)
+        self.maxsize = maxsize
+        self._blocks = {}
+        self._pages = {} # page name -> keys of the blocks listing it
+
+    def reset(self):
+        self._blocks = {}
+        self._pages = {}
+
+    def changed(self, pagenames):
+        for name in pagenames:
+            for key in self._pages.pop(name, ()):
+                self._blocks.pop(key, None)
+
+    def get(self, key):
+        self._lock.acquire()
+        try:
+            return self._blocks.get(key)
+        finally:
+            self._lock.release()
+
+    def set(self, key, html, pagenames):
+        """ Cache a day block
+
+        @param key: block key, see ThemeBase.recentchanges_day
+        @param html: rendered block
+        @param pagenames: names of the pages listed in the block
+        """
+        self._lock.acquire()
+        try:
+            if len(self._blocks) >= self.maxsize:
+                self.reset()
+            self._blocks[key] = html
+            for name in pagenames:
+                self._pages.setdefault(name, []).append(key)
+        finally:
+            self._lock.release()
+
+# RecentChanges day caches by theme, config and script name
+_recentchanges_days = {}
+
+
+class FragmentTimer:
+    """ Wall time spent rendering the theme fragments of one request
+
+    Created only when cfg.theme_timing is set, see
+    ThemeBase.fragmentTimer. Fragment functions are wrapped to record
+    their time; longer spans, like the page body between header and
+    footer, are recorded with start and stop.
+    """
+
+    def __init__(self):
+        self.timings = [] # (name, seconds), in the order they ended
+        self._started = {}
+
+    def start(self, name):
+        self._started[name] = time.time()
+
+    def stop(self, name):
+        started = self._started.pop(name, None)
+        if started is not None:
+            self.timings.append((name, time.time() - started))
+
+    def wrap(self, name, function):
+        """ Return function, recording the time of each call as name """
+        def timed(*args, **kw):
+            started = time.time()
+            try:
+                return function(*args, **kw)
+            finally:
+                self.timings.append((name, time.time() - started))
+        return timed
+
+    def wrapSlots(self, slots, prefix):
+        """ Wrap a dict of slot functions, see wrap
+
+        @param slots: dict mapping slot names to functions
+        @param prefix: prefix of the timing names, e.g. 'header'
+        @rtype: dict
+        @return: slot name -> timed function
+        """
+        return dict([(name, self.wrap('%s.%s' % (prefix, name), function))
+                     for name, function in slots.items()])
+
+    def serverTiming(self):
+        """ Return the timings as Server-Timing header value """
+        return ', '.join(['%s;dur=%.2f' % (name, seconds * 1000)
+                          for name, seconds in self.timings])
+
+    def report(self, request):
+        """ Report the timings recorded so far
+
+        Sets a Server-Timing header when the response headers were not
+        sent yet, which is the case only when the page is buffered.
+
+        @param request: the request object
+        @rtype: string
+        @return: timings as html comment
+        """
+        if (hasattr(request, 'setHttpHeader') and
+            not getattr(request, 'sent_headers', 0)):
+            request.setHttpHeader('Server-Timing: %s' % self.serverTiming())
+        lines = ['%-24s %8.2f ms' % (name, seconds * 1000)
+                 for name, seconds in self.timings]
+        return '\n<!-- theme fragment timing\n%s\n-->\n' % '\n'.join(lines)
+
+
+class Permissions:
+    """ Request scoped memo of permission checks
+
+    A theme asks the same questions several times for one page view,
+    e.g. whether the user may read the page in shouldShowPageinfo and
+    shouldShowEditbar. Each answer is computed once per request and
+    user; saved counts the checks answered from the memo.
+
+    Use like request.user.may: may.read(pagename), may.write(pagename).
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self.saved = 0
+        self._user = None
+        self._decisions = {}
+
+    def __getattr__(self, right):
+        if right.startswith('_'):
+            raise AttributeError(right)
+        def check(pagename):
+            return self._decide((right, pagename), getattr(
+                self.request.user.may, right), pagename)
+        setattr(self, right, check)
+        return check
+
+    def isWritable(self, page):
+        """ Return page.isWritable(), checked once per request """
+        return self._decide(('isWritable', page.page_name), page.isWritable)
+
+    def _decide(self, key, check, *args):
+        if self.request.user is not self._user:
+            # The user logged in or out, forget the old answers
+            self._user = self.request.user
+            self._decisions = {}
+        try:
+            decision = self._decisions[key]
+            self.saved += 1
+        except KeyError:
+            decision = self._decisions[key] = check(*args)
+        return decision
+
+
+class PagePool:
+    """ Request scoped pool of pages
+
+    title, navibar and trail often link the same pages, and linking a
+    page checks whether it exists on disk. Pages from the pool are
+    created once per request and check their existence once; hits and
+    misses count the existence checks answered from the pool and from
+    the storage.
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self.hits = 0
+        self.misses = 0
+        self._pages = {}
+        self._exists = {}
+
+    def get(self, pagename):
+        """ Return the pooled page named pagename """
+        try:
+            return self._pages[pagename]
+        except KeyError:
+            page = self._pages[pagename] = PooledPage(self, pagename)
+            return page
+
+    def exists(self, page, includeDeleted=0):
+        """ Return whether a pooled page exists, see Page.exists """
+        key = (page.page_name, includeDeleted)
+        try:
+            exists = self._exists[key]
+            self.hits += 1
+        except KeyError:
+            exists = Page.exists(page, includeDeleted=includeDeleted)
+            self._exists[key] = exists
+            self.misses += 1
+        return exists
+
+
+class PooledPage(Page):
+    """ Page checking its existence through a PagePool """
+
+    def __init__(self, pool, page_name):
+        Page.__init__(self, pool.request, page_name)
+        self._pool = pool
+
+    def exists(self, rev=0, domain=None, includeDeleted=0):
+        if rev or domain:
+            return Page.exists(self, rev, domain, includeDeleted)
+        return self._pool.exists(self, includeDeleted)
+
+
+def configCache(cls, cfg):
+    """ Return the cache of a theme class for elements depending on cfg
+
+    Theme objects are made per request, the cache is shared by all
+    themes of the class rendering for the same config.
+    """
+    key = (cls, configKey(cfg))
+    try:
+        return _config_caches[key]
+    except KeyError:
+        cache = _config_caches[key] = {}
+        return cache
+
+# Config caches by theme class and config
+_config_caches = {}
+
+
+class URLSchemes:
+    """ Recognizer for the URL schemes of config.url_schemas
+
+    A text is an URL if the part before its first colon is a scheme, so
+    one set lookup replaces a startswith test per scheme. The set is
+    rebuilt when config.url_schemas is replaced or extended.
+    """
+
+    def __init__(self):
+        self._schemas = None
+        self._length = 0
+        self._names = {}
+
+    def scheme(self, text):
+        """ Return the URL scheme a text starts with
+
+        @param text: link target
+        @rtype: string
+        @return: scheme without colon, or None if text is not an URL
+        """
+        schemas = config.url_schemas
+        if schemas is not self._schemas or len(schemas) != self._length:
+            names = {}
+            for name in schemas:
+                names[name] = 1
+            self._names = names
+            self._schemas, self._length = schemas, len(schemas)
+        colon = text.find(':')
+        if colon != -1 and text[:colon] in self._names:
+            return text[:colon]
+        return None
+
+url_schemes = URLSchemes()
+urlScheme = url_schemes.scheme
+
+# Icon file name indexes, see ThemeBase.icons_by_file
+_icon_indexes = {}
+
+# Custom action menu titles, split once per process
+_action_titles = {}
 
 
 class ThemeBase:
@@ -109,6 +803,10 @@ class ThemeBase:
         self.request = request
         self.cfg = request.cfg
         self._cache = {} # Used to cache elements that may be used several times
+        # Used to cache elements depending only on cfg, for all requests
+        self._config_cache = configCache(self.__class__, self.cfg)
+        self.may = Permissions(request) # Used for all permission checks
+        self.pages = PagePool(request) # Used for pages linked by the theme
 
     def img_url(self, img):
         """ Generate an image href
@@ -117,8 +815,139 @@ class ThemeBase:
         @rtype: string
         @return: the image href
         """
-        return "%s/%s/img/%s" % (self.cfg.url_prefix, self.name, img)
-        
+        return self.asset_url("%s/img/%s" % (self.name, img))
+
+    def asset_url(self, path):
+        """ Generate the href of a static asset
+
+        Use the content hashed copy of the asset made by
+        tools/fingerprint.py if the theme manifest lists one. Its url
+        changes whenever the content changes, so it can be cached by
+        browsers forever.
+
+        @param path: asset path below url_prefix, e.g. kaijin/img/x.png
+        @rtype: string
+        @return: the asset href
+        """
+        return "%s/%s" % (self.cfg.url_prefix, self.hashedAsset(path) or path)
+
+    def assetManifest(self):
+        """ Return the asset manifest of the theme
+
+        The manifest is read from the theme directory below
+        cfg.theme_htdocs_dir, the file system path of the directory
+        served at url_prefix. Without that setting, it is empty.
+
+        @rtype: dict
+        @return: kind -> {name: tuple of values}, see loadManifest
+        """
+        manifest = self._config_cache.get('manifest')
+        if manifest is None:
+            filename = self.manifestFilename()
+            if filename:
+                manifest = loadManifest(filename)
+            else:
+                manifest = {}
+            self._config_cache['manifest'] = manifest
+        return manifest
+
+    def manifestFilename(self):
+        """ Return the file name of the asset manifest, or None """
+        htdocs = getattr(self.cfg, 'theme_htdocs_dir', None)
+        if htdocs:
+            return os.path.join(htdocs, self.name, 'manifest.txt')
+        return None
+
+    def assetVersion(self):
+        """ Return the version of the theme code and assets in use
+
+        Changes when the theme modules are changed, and when the build
+        tools wrote a new manifest, which may have removed the hashed
+        files that cached html links.
+
+        @rtype: tuple
+        @return: theme version, manifest modification time
+        """
+        self.assetManifest()
+        return (themeVersion(self.__class__),
+                _manifest_mtimes.get(self.manifestFilename(), 0))
+
+    def hashedAsset(self, path):
+        """ Return the content hashed copy of a static asset
+
+        @param path: asset path below url_prefix, e.g. kaijin/js/x.js
+        @rtype: string
+        @return: hashed path made by tools/fingerprint.py, or None
+        """
+        asset = self.assetManifest().get('asset', {}).get(path)
+        return asset and asset[0]
+
+    def fragmentCache(self):
+        """ Return the cache for html shared between requests
+
+        cfg.theme_fragment_cache may be any object with the get, set
+        and clear methods of FragmentCache. Else, with cfg.theme_cache_dir
+        set, a FileFragmentCache in that directory is shared by all
+        processes of the host, limited by cfg.theme_cache_ttl (seconds)
+        and cfg.theme_cache_size (files). Its files outlive the worker
+        processes, so they are versioned by the MoinMoin release and
+        the theme and asset versions, see assetVersion. By default,
+        each process has its own cache.
+
+        @rtype: FragmentCache
+        @return: fragment cache
+        """
+        cache = self._config_cache.get('fragment_cache')
+        if cache is None:
+            cfg = self.cfg
+            cache = getattr(cfg, 'theme_fragment_cache', None)
+            directory = getattr(cfg, 'theme_cache_dir', None)
+            if cache is None and directory:
+                settings = (directory, getattr(cfg, 'theme_cache_ttl', 86400),
+                            getattr(cfg, 'theme_cache_size', 5000),
+                            repr((version.release, self.assetVersion())))
+                cache = _file_caches.get(settings)
+                if cache is None:
+                    cache = _file_caches[settings] = FileFragmentCache(*settings)
+            if cache is None:
+                cache = fragment_cache
+            self._config_cache['fragment_cache'] = cache
+        return cache
+
+    def fragmentTimer(self):
+        """ Return the fragment timer of the request, see FragmentTimer
+
+        @rtype: FragmentTimer
+        @return: timer, or None unless cfg.theme_timing is set
+        """
+        timer = self._cache.get('fragment_timer', 0)
+        if timer == 0:
+            timer = None
+            if getattr(self.cfg, 'theme_timing', 0):
+                timer = FragmentTimer()
+            self._cache['fragment_timer'] = timer
+        return timer
+
+    def editlogStamp(self):
+        """ Return a stamp of the global edit log
+
+        The stamp changes whenever a page is saved, created, renamed or
+        deleted, so it can be used in cache keys of html containing page
+        links, which look different for non existing pages.
+
+        @rtype: tuple
+        @return: edit log inode, size and modification time
+        """
+        stamp = self._cache.get('editlog_stamp')
+        if stamp is None:
+            try:
+                st = os.stat(editlogFilename(self.cfg))
+                stamp = (st.st_ino, st.st_size, st.st_mtime)
+            except OSError:
+                stamp = ()
+            self._cache['editlog_stamp'] = stamp
+        return stamp
+
     def emit_custom_html(self, html):
         """
         generate custom HTML code in `html`
@@ -177,12 +1006,8 @@ class ThemeBase:
         content = []
         if d['title_link']: # having a link means we have a (linked) pagename ONLY as title, not a message title
                             # XXX this method is rather ugly and should be improved
-            curpage = ''
             segments = d['page_name'].split('/') # was: title_text
-            for s in segments[:-1]:
-                curpage += s
-                content.append("<li>%s</li>" % Page(self.request, curpage).link_to(self.request, s))
-                curpage += '/'
+            content.extend(self.hierarchy().ancestors(self, segments))
             content.append(('<li><a class="backlink" title="%(title)s" href="%(href)s">%(text)s</a></li>') % {
                 'title': _('Click to do a full-text search for this title'),
                 'href': d['title_link'],
@@ -198,6 +1023,19 @@ class ThemeBase:
 ''' % "".join(content)
         return html
 
+    def hierarchy(self):
+        """ Return the breadcrumb index of the wiki, see PageHierarchy
+
+        @rtype: PageHierarchy
+        @return: index synced with the edit log
+        """
+        key = (self.name, configKey(self.cfg), self.request.getScriptname())
+        index = _hierarchies.get(key)
+        if index is None:
+            index = _hierarchies[key] = PageHierarchy()
+        index.sync(editlogFilename(self.cfg), self.editlogStamp())
+        return index
+
     def username(self, d):
         """ Assemble the username / userprefs link
         
@@ -239,9 +1077,27 @@ class ThemeBase:
         html = u'<ul id="username">%s</ul>' % ''.join(userlinks)
         return html
 
-    # Schemas supported in toolbar links, using [url label] format
+    # Schemas supported in toolbar links, using [url label] format. Only
+    # used when overridden in a sub class, see urlScheme.
     linkSchemas = [x + ':' for x in config.url_schemas]
 
+    def urlScheme(self, text):
+        """ Return the URL scheme of a toolbar link
+
+        Looked up in config.url_schemas, see URLSchemes, unless a sub
+        class overrides linkSchemas.
+
+        @param text: link target
+        @rtype: string
+        @return: scheme without colon, or None if text is not an URL
+        """
+        if self.linkSchemas is not ThemeBase.linkSchemas:
+            for scheme in self.linkSchemas:
+                if text.startswith(scheme):
+                    return scheme[:-1]
+            return None
+        return urlScheme(text)
+
     def splitNavilink(self, text, localize=1):
         """ Split navibar links into pagename, link to page
 
@@ -272,19 +1128,17 @@ class ThemeBase:
             if localize:
                 page = wikiutil.getSysPage(request, text)
             else:
-                page = Page(request, text)
+                page = self.pages.get(text)
             pagename = page.page_name
             title = page.split_title(request)
             title = self.shortenPagename(title)
             link = page.link_to(request, title)
 
 
-        from MoinMoin import config
-        for scheme in self.linkSchemas:
-            if pagename.startswith(scheme):
-                title = wikiutil.escape(title)
-                link = '<a href="%s">%s</a>' % (pagename, title)
-                return pagename, link
+        if self.urlScheme(pagename):
+            title = wikiutil.escape(title)
+            link = '<a href="%s">%s</a>' % (pagename, title)
+            return pagename, link
 
         # remove wiki: url prefix
         if pagename.startswith("wiki:"):
@@ -312,7 +1166,7 @@ class ThemeBase:
         # [name_with_spaces label] we must save the underscores
         # until this point.
         pagename = request.normalizePagename(pagename)
-        link = Page(request, pagename).link_to(request, title)
+        link = self.pages.get(pagename).link_to(request, title)
 
         return pagename, link
 
@@ -359,8 +1213,7 @@ class ThemeBase:
 
         # Process config navi_bar
         if request.cfg.navi_bar:
-            for text in request.cfg.navi_bar:
-                pagename, link = self.splitNavilink(text)
+            for pagename, link in self.navibarLinks():
                 if pagename == current:
                     cls = 'wikilink current'
                 else:
@@ -398,6 +1251,30 @@ class ThemeBase:
 ''' % items
         return html
 
+    def navibarLinks(self):
+        """ Return the split config navi_bar links
+
+        Splitting the links creates pages and checks them on disk, but
+        the result depends only on the config, the user interface
+        language, the existing pages and whether the user wants spaces
+        in page titles. The links are kept in the fragment cache;
+        navibar marks the current page itself.
+
+        @rtype: tuple
+        @return: (pagename, link) pairs, in config order
+        """
+        request = self.request
+        key = ('navibar', self.name, configKey(self.cfg), request.lang,
+               request.getScriptname(), self.editlogStamp(),
+               getattr(request.user, 'wikiname_add_spaces', 0))
+        cache = self.fragmentCache()
+        links = cache.get(key)
+        if links is None:
+            links = tuple([self.splitNavilink(text)
+                           for text in self.cfg.navi_bar])
+            cache.set(key, links)
+        return links
+
     def get_icon(self, icon):
         """ Return icon data from self.icons
 
@@ -412,51 +1289,224 @@ class ThemeBase:
         if icon in self.icons:
             alt, filename, w, h = self.icons[icon]
         else:
-            # Create filenames to icon data mapping on first call, then
-            # cache in class for next calls.
-            if not getattr(self.__class__, 'iconsByFile', None):
-                d = {}
-                for data in self.icons.values():
-                    d[data[1]] = data
-                self.__class__.iconsByFile = d
-
             # Try to get icon data by file name
             filename = icon.replace('.gif','.png')
-            if filename in self.iconsByFile:
-                alt, filename, w, h = self.iconsByFile[filename]
+            data = self.icons_by_file().get(filename)
+            if data:
+                alt, filename, w, h = data
             else:
                 alt, filename, w, h = '', icon, '', ''
                 
         return alt, self.img_url(filename), w, h
+
+    def icons_by_file(self):
+        """ Return an index of self.icons by file name
+
+        The index is built once per icons table and kept in a module
+        dict, not on the class, so a sub class with its own icons gets
+        its own index.
+
+        @rtype: dict
+        @return: file name -> icon data
+        """
+        icons = self.icons
+        try:
+            indexed, index = _icon_indexes[self.__class__]
+            if indexed is icons:
+                return index
+        except KeyError:
+            pass
+        index = {}
+        for data in icons.values():
+            index[data[1]] = data
+        _icon_indexes[self.__class__] = (icons, index)
+        return index
+
+    def get_sprite(self, icon, w, h):
+        """ Return the css class of an icon in the theme sprite
+
+        The sprite and its css class map are made by
+        tools/makesprite.py and listed in the theme manifest. The
+        sprite has each icon at the size it is shown, so an icon is
+        looked up with its size.
+
+        @param icon: icon name or file name (string)
+        @param w: width the icon is shown at
+        @param h: height the icon is shown at
+        @rtype: string
+        @return: css class, or None if the icon is not in a sprite
+        """
+        sprites = self.assetManifest().get('sprite')
+        if not sprites:
+            return None
+        filename = self.icons.get(icon, (None, icon))[1]
+        data = sprites.get('%s@%sx%s' % (filename.replace('.gif', '.png'),
+                                         w, h))
+        return data and data[0]
+
+    def icon_tables(self):
+        """ Return the precomputed icons of the user interface language
+
+        Icons with a fixed alt text are rendered once per language and
+        formatter. For icons with placeholders in the alt text, only the
+        href, size and sprite are precomputed. The tables are kept in
+        the fragment cache.
+
+        @rtype: tuple
+        @return: dict icon -> html of icons with a fixed alt text,
+                 dict icon -> (alt, href, w, h, sprite) of other icons
+        """
+        tables = self._cache.get('icons')
+        if tables is None:
+            request = self.request
+            formatter = getattr(request, 'formatter', None)
+            key = ('icons', self.name, configKey(self.cfg), request.lang,
+                   formatter.__class__.__module__)
+            cache = self.fragmentCache()
+            tables = cache.get(key)
+            if tables is None:
+                markup, templates = {}, {}
+                for icon in self.icons:
+                    data = self.icon_template(icon)
+                    if '%(' in data[0]:
+                        templates[icon] = data
+                    else:
+                        alt = request.getText(data[0], formatted=False)
+                        markup[icon] = self.icon_tag(alt, *data[1:])
+                tables = (markup, templates)
+                cache.set(key, tables)
+            self._cache['icons'] = tables
+        return tables
+
+    def icon_template(self, icon):
+        """ Return the data needed to render an icon
+
+        @param icon: icon name or file name (string)
+        @rtype: tuple
+        @return: alt (unicode), href (string), width, height (int),
+                 sprite css class or None
+        """
+        alt, img, w, h = self.get_icon(icon)
+        return alt, img, w, h, self.get_sprite(icon, w, h)
+
+    def icon_tag(self, alt, img, w, h, sprite=None):
+        """ Return the html of an icon
+
+        @param alt: final alt text
+        @param img: image href
+        @param w: width
+        @param h: height
+        @param sprite: css class of the icon in the theme sprite
+        @rtype: string
+        @return: icon html (img tag, or sized element for sprites)
+        """
+        if sprite:
+            # A sized element showing the icon from the sprite, the
+            # text is hidden by the sprite style sheet.
+            alt = wikiutil.escape(alt, 1)
+            return u'<span class="sprite %s" title="%s">%s</span>' % (
+                sprite, alt, alt)
+        try:
+            tag = self.request.formatter.image(src=img, alt=alt, width=w, height=h)
+        except AttributeError: # XXX FIXME if we have no formatter or no request 
+            tag = '<img src="%s" alt="%s" width="%s" height="%s">' % (
+                img, alt, w, h)
+            import warnings
+            warnings.warn("calling themes without correct request", DeprecationWarning)
+        return tag
    
     def make_icon(self, icon, vars=None):
         """
         This is the central routine for making <img> tags for icons!
         All icons stuff except the top left logo, smileys and search
         field icons are handled here.
+
+        Icons of self.icons come from the precomputed icon tables, see
+        icon_tables.
         
         @param icon: icon id (dict key)
         @param vars: ...
         @rtype: string
         @return: icon html (img tag)
         """
+        markup, templates = self.icon_tables()
+        tag = markup.get(icon)
+        if tag is not None:
+            return tag
+
         if vars is None:
             vars = {}
-        alt, img, w, h = self.get_icon(icon)
+        data = templates.get(icon) or self.icon_template(icon)
+        alt = data[0]
         try:
             alt = alt % vars
         except KeyError, err:
             alt = 'KeyError: %s' % str(err)
-        if self.request:
-            alt = self.request.getText(alt, formatted=False)
-        try:
-            tag = self.request.formatter.image(src=img, alt=alt, width=w, height=h)
-        except AttributeError: # XXX FIXME if we have no formatter or no request 
-            tag = '<img src="%s" alt="%s" width="%s" height="%s">' % (
-                img, alt, w, h)
-            import warnings
-            warnings.warn("calling themes without correct request", DeprecationWarning)
-        return tag
+        alt = self.request.getText(alt, formatted=False)
+        return self.icon_tag(alt, *data[1:])
+
+    def smiley_table(self):
+        """ Return the precomputed html of all smileys
+
+        Rendered once per theme and formatter, like the icons, and kept
+        in the fragment cache. Smileys in the theme sprite are shown
+        from the sprite. MoinMoin does not call this; a formatter can
+        use make_smiley in its smiley method, see README.md.
+
+        @rtype: dict
+        @return: smiley text -> html
+        """
+        table = self._cache.get('smileys')
+        if table is None:
+            formatter = getattr(self.request, 'formatter', None)
+            key = ('smileys', self.name, configKey(self.cfg),
+                   formatter.__class__.__module__)
+            cache = self.fragmentCache()
+            table = cache.get(key)
+            if table is None:
+                table = {}
+                for text, (w, h, b, img) in config.smileys.items():
+                    if img.startswith('/'):
+                        href, sprite = img, None
+                    else:
+                        href = self.img_url(img)
+                        sprite = self.get_sprite(img, w, h)
+                    table[text] = self.icon_tag(text, href, w, h, sprite)
+                cache.set(key, table)
+            self._cache['smileys'] = table
+        return table
+
+    def make_smiley(self, text):
+        """ Return the html of a smiley
+
+        @param text: smiley text, a key of config.smileys
+        @rtype: string
+        @return: smiley html, or the escaped text if the user does not
+                 want to see smileys
+        """
+        if getattr(self.request.user, 'show_emoticons', 1):
+            html = self.smiley_table().get(text)
+            if html is not None:
+                return html
+        return wikiutil.escape(text)
+
+    def render_smileys(self, text):
+        """ Escape a text and replace the smileys in it, in one scan
+
+        @param text: plain text
+        @rtype: string
+        @return: html
+        """
+        if not getattr(self.request.user, 'show_emoticons', 1):
+            return wikiutil.escape(text)
+        table = self.smiley_table()
+        parts = config.smiley_re.split(text)
+        for i in range(len(parts)):
+            if i % 2:
+                parts[i] = table[parts[i]]
+            else:
+                parts[i] = wikiutil.escape(parts[i])
+        return ''.join(parts)
 
     def make_iconlink(self, which, d):
         """
@@ -501,6 +1551,11 @@ class ThemeBase:
         
     def trail(self, d):
         """ Assemble page trail
+
+        The trail changes only when the user visits another page. The
+        html is kept in the fragment cache, keyed by a digest of the
+        trail, the user interface language, the page title spacing
+        preference and the edit log stamp.
         
         @param d: parameter dictionary
         @rtype: unicode
@@ -512,30 +1567,49 @@ class ThemeBase:
         if user.valid and user.show_page_trail:
             trail = user.getTrail()
             if trail:
-                items = []
-                for pagename in trail:
-                    try:
-                        interwiki, page = pagename.split(":", 1)
-                        # Items in trail are saved as valid interwiki
-                        # links, using _ for spaces.
-                        page = page.replace('_', ' ')
-                        if request.cfg.interwikiname != interwiki:
-                            link = (self.request.formatter.interwikilink(True, interwiki, page) +
-                                    self.shortenPagename(page) +
-                                    self.request.formatter.interwikilink(False, interwiki, page))
-                            items.append('<li>%s</li>' % link)
-                            continue
-                        else:
-                            pagename = page
-                            
-                    except ValueError:
-                        pass
-                    page = Page(request, pagename)
-                    title = page.split_title(request)
-                    title = self.shortenPagename(title)
-                    link = page.link_to(request, title)
+                digest = md5(u'\n'.join(trail).encode('utf-8')).hexdigest()
+                key = ('trail', self.name, configKey(self.cfg), request.lang,
+                       request.getScriptname(), self.editlogStamp(), digest,
+                       getattr(user, 'wikiname_add_spaces', 0))
+                cache = self.fragmentCache()
+                html = cache.get(key)
+                if html is None:
+                    html = self.renderTrail(trail)
+                    cache.set(key, html)
+        return html
+
+    def renderTrail(self, trail):
+        """ Render the page trail, see trail
+
+        @param trail: list of page names and interwiki links
+        @rtype: unicode
+        @return: trail html
+        """
+        request = self.request
+        items = []
+        for pagename in trail:
+            try:
+                interwiki, page = pagename.split(":", 1)
+                # Items in trail are saved as valid interwiki
+                # links, using _ for spaces.
+                page = page.replace('_', ' ')
+                if request.cfg.interwikiname != interwiki:
+                    link = (self.request.formatter.interwikilink(True, interwiki, page) +
+                            self.shortenPagename(page) +
+                            self.request.formatter.interwikilink(False, interwiki, page))
                     items.append('<li>%s</li>' % link)
-                html = '''
+                    continue
+                else:
+                    pagename = page
+                    
+            except ValueError:
+                pass
+            page = self.pages.get(pagename)
+            title = page.split_title(request)
+            title = self.shortenPagename(title)
+            link = page.link_to(request, title)
+            items.append('<li>%s</li>' % link)
+        html = '''
 <ul id="pagetrail">
 %s
 </ul>''' % ''.join(items)
@@ -555,16 +1629,31 @@ class ThemeBase:
             media = d.get('media', 'print')
             stylesheets = getattr(self, 'stylesheets_' + media)
         else:
+            media = 'screen'
             stylesheets = self.stylesheets
         usercss = self.request.user.valid and self.request.user.css_url
 
-        # Create stylesheets links
+        # Create stylesheets links, or a single link to the bundle of
+        # the mode made by tools/bundlecss.py
         html = []
         prefix = self.cfg.url_prefix
-        csshref = '%s/%s/css' % (prefix, self.name)
+        manifest = self.assetManifest()
+        bundle = manifest.get('bundle', {}).get(media)
+        if bundle:
+            href = '%s/%s' % (prefix, bundle[0])
+            html.append(link % (self.stylesheetsCharset, 'all', href))
+
+        # Icon sprite map made by tools/makesprite.py, unless bundled
+        sprites = manifest.get('spritesheet', {}).get('css')
+        if sprites and not (bundle and sprites[0] in bundle[1:]):
+            href = '%s/%s' % (prefix, sprites[0])
+            html.append(link % (self.stylesheetsCharset, 'all', href))
         for media, basename in stylesheets:
-            href = '%s/%s.css' % (csshref, basename)
-            html.append(link % (self.stylesheetsCharset, media, href))
+            path = '%s/css/%s.css' % (self.name, basename)
+            href = '%s/%s' % (prefix, path)
+            if not bundle:
+                html.append(link % (self.stylesheetsCharset, media,
+                                    self.asset_url(path)))
 
             # Don't add user css url if it matches one of ours
             if usercss and usercss == href:
@@ -584,7 +1673,7 @@ class ThemeBase:
 <![endif]-->
 """ % prefix)
 
-        csshref = '%s/%s/css/msie.css' % (prefix, self.name)
+        csshref = self.asset_url('%s/css/msie.css' % self.name)
         html.append("""
 <!-- css only for MSIE browsers -->
 <!--[if IE]>
@@ -608,7 +1697,7 @@ class ThemeBase:
         @rtype: bool
         @return: true if should show page info
         """
-        if page.exists() and self.request.user.may.read(page.page_name):
+        if page.exists() and self.may.read(page.page_name):
             # These  actions show the  page content.
             # TODO: on new action, page info will not show. A better
             # solution will be if the action itself answer the question:
@@ -804,7 +1893,7 @@ function actionsMenuInit(title) {
         """ Return True if RSS feature is available and we are on the
             RecentChanges page, or False.
         """
-        if not rss_supported:
+        if not rssSupported():
             return False
         return page.page_name == u'RecentChanges' or \
            page.page_name == self.request.getText(u'RecentChanges', formatted=False)
@@ -843,19 +1932,137 @@ function actionsMenuInit(title) {
         @rtype: unicode
         @return: html head
         """
-        html = [
-            u'<title>%(title)s - %(sitename)s</title>' % d,
-            self.externalScript('common'),
-            self.headscript(d), # Should move to separate .js file
-            self.guiEditorScript(d),
-            self.html_stylesheets(d),
-            self.rsslink(d),
+        return '\n'.join([part() for name, part in self.htmlHeadParts(d)])
+
+    def html_head_chunks(self, d):
+        """ Assemble html head in chunks
+
+        Each item is yielded as soon as it is ready, so the server can
+        send the head to the client before the slow parts of the page
+        are computed. The joined chunks are equal to html_head(d).
+
+        @param d: parameter dictionary
+        @rtype: generator
+        @return: html head chunks
+        """
+        parts = self.htmlHeadParts(d)
+        yield parts[0][1]()
+        for name, part in parts[1:]:
+            yield '\n' + part()
+
+    def htmlHeadParts(self, d):
+        """ Return the parts of the html head, timed if enabled
+
+        @param d: parameter dictionary
+        @rtype: list
+        @return: (name, function returning the part html) tuples
+        """
+        parts = [
+            ('title', lambda: u'<title>%(title)s - %(sitename)s</title>' % d),
+            ('commonjs', lambda: self.externalScript('common')),
+            ('headscript', lambda: self.headscript(d)),
+            ('guieditor', lambda: self.guiEditorScript(d)),
+            ('stylesheets', lambda: self.html_stylesheets(d)),
+            ('rss', lambda: self.rsslink(d)),
             ]
-        return '\n'.join(html)
+        timer = self.fragmentTimer()
+        if timer:
+            parts = [(name, timer.wrap('head.' + name, part))
+                     for name, part in parts]
+        return parts
+
+    def send_chunks(self, chunks):
+        """ Write html chunks to the client, flushing after each chunk
+
+        Use with html_head_chunks or the *_chunks methods of themes to
+        let the browser fetch style sheets and scripts while the rest
+        of the page is rendered. MoinMoin itself sends the strings
+        returned by send_title and footer; the chunk methods are an
+        opt-in API for actions and servers that stream the page, like
+        notModified is for conditional requests.
+
+        @param chunks: iterable of html chunks
+        """
+        request = self.request
+        for chunk in chunks:
+            if chunk:
+                request.write(chunk)
+                request.flush()
+
+    def etag(self, d):
+        """ Return an entity tag of the page rendered with d
+
+        A digest of everything the theme output depends on: the theme
+        and wiki versions, the config, the user and the preferences the
+        theme uses, the language, the page name and revision, the
+        message, the trail, the quicklinks, the subscription, the query
+        string, which holds the view, the search value and highlight,
+        and the edit log stamp, which changes whenever any page is
+        changed. It is cheap to compute and needs no rendering.
+
+        @param d: parameter dictionary, with at least 'page' and 'msg'
+        @rtype: string
+        @return: quoted entity tag, or None if the page content is not
+                 cacheable, e.g. when it uses dynamic macros
+        """
+        request = self.request
+        user = request.user
+        page = d['page']
+        if not page.canUseCache():
+            return None
+        pagename = page.page_name
+        # Preferences of anonymous users too: the last edit time and
+        # page titles, smileys
+        prefs = (getattr(user, 'tz_offset', 0),
+                 getattr(user, 'datetime_fmt', ''),
+                 getattr(user, 'wikiname_add_spaces', 0),
+                 getattr(user, 'show_emoticons', 1))
+        userdata = ()
+        if user.valid:
+            subscribed = self.cfg.mail_enabled and user.isSubscribedTo([pagename])
+            trail = ()
+            if user.show_page_trail:
+                trail = user.getTrail()
+            userdata = (user.id, user.name, user.aliasname, user.css_url,
+                        user.editor_ui, trail, user.getQuickLinks(),
+                        subscribed, user.isQuickLinkedTo([pagename]))
+        inputs = (self.name, themeVersion(self.__class__), version.release,
+                  configKey(self.cfg), request.getScriptname(), prefs,
+                  userdata, request.lang, pagename, getattr(page, 'rev', 0),
+                  d['msg'], getattr(request, 'query_string', ''),
+                  d.get('print_mode'), d.get('media'), self.editlogStamp())
+        return '"%s"' % md5(repr(inputs)).hexdigest()
+
+    def notModified(self, d):
+        """ Answer a conditional GET of the page
+
+        Sets the ETag header, and tells whether the client sent the same
+        tag in If-None-Match. If so, send only a 304 Not Modified
+        response: the header, body and footer need not be rendered.
+
+        @param d: parameter dictionary, see etag
+        @rtype: bool
+        @return: True if the client has the current page
+        """
+        tag = self.etag(d)
+        if tag is None:
+            return False
+        request = self.request
+        request.setHttpHeader('ETag: %s' % tag)
+        match = getattr(request, 'if_none_match', None)
+        if not match:
+            return False
+        for item in match.split(','):
+            item = item.strip()
+            if item.startswith('W/'):
+                item = item[2:]
+            if item == tag or item == '*':
+                return True
+        return False
 
     def externalScript(self, name):
         """ Format external script html """
-        src = '%s/common/js/%s.js' % (self.request.cfg.url_prefix, name)
+        src = self.asset_url('common/js/%s.js' % name)
         return '<script type="text/javascript" src="%s"></script>' % src
 
     def credits(self, d, **keywords):
@@ -883,11 +2090,35 @@ function actionsMenuInit(title) {
         that the theme will render body, its currently done on
         wikiutil/page.
         
+        The menu depends only on the user interface language, the
+        actions available and whether the page can use the cache, so it
+        is rendered once for each of them and kept in the fragment cache.
+        
         @param page: current page, Page object
         @rtype: unicode
         @return: actions menu html fragment
         """
         request = self.request
+        available = request.getAvailableActions(page)
+        canUseCache = page.canUseCache()
+        key = ('actionsmenu', self.name, configKey(self.cfg), request.lang,
+               tuple(sorted(available)), canUseCache)
+        cache = self.fragmentCache()
+        html = cache.get(key)
+        if html is None:
+            html = self.renderActionsMenu(available, canUseCache)
+            cache.set(key, html)
+        return html
+
+    def renderActionsMenu(self, available, canUseCache):
+        """ Render the actions menu, see actionsMenu
+
+        @param available: actions available for the user and page
+        @param canUseCache: whether the page can use the cache
+        @rtype: unicode
+        @return: actions menu html fragment
+        """
+        request = self.request
         _ = request.getText
         
         menu = [
@@ -938,13 +2169,12 @@ function actionsMenuInit(title) {
         disabled = ' disabled class="disabled"'
         
         # Format standard actions
-        available = request.getAvailableActions(page)
         for action in menu:
             data = {'action': action, 'disabled': '', 'title': titles[action]}
 
             # Enable delete cache only if page can use caching
             if action == 'refresh':
-                if not page.canUseCache():
+                if not canUseCache:
                     data['action'] = 'show'
                     data['disabled'] = disabled
 
@@ -972,9 +2202,11 @@ function actionsMenuInit(title) {
             # Add more actions (all enabled)
             for action in more:
                 data = {'action': action, 'disabled': ''}
-                # Always add spaces: AttachFile -> Attach File 
-                # XXX TODO do not create page just for using split_title
-                title = Page(request, action).split_title(request, force=1)
+                title = _action_titles.get(action)
+                if title is None:
+                    # Always add spaces: AttachFile -> Attach File 
+                    title = Page(request, action).split_title(request, force=1)
+                    _action_titles[action] = title
                 # Use translated version if available
                 data['title'] = _(title, formatted=False)
                 options.append(option % data)
@@ -1047,7 +2279,7 @@ actionsMenuInit('%(label)s');
         # that the user may read. If you may not read, you can't edit,
         # so you don't need editbar.
         if (page.exists(includeDeleted=1) and
-            self.request.user.may.read(page.page_name)):
+            self.may.read(page.page_name)):
             form = self.request.form
             action = form.get('action', [''])[0]
             # Do not show editbar on edit but on save/cancel
@@ -1084,8 +2316,8 @@ actionsMenuInit('%(label)s');
         If the user want to show both editors, it will display "Edit
         (Text)", otherwise as "Edit".
         """
-        if not (page.isWritable() and
-                self.request.user.may.write(page.page_name)):
+        if not (self.may.isWritable(page) and
+                self.may.write(page.page_name)):
             return self.disabledEdit()
         
         _ = self.request.getText
@@ -1123,8 +2355,8 @@ actionsMenuInit('%(label)s');
         the browser is compatible with the editor.
         """
         page = d['page']
-        if not (page.isWritable() and
-                self.request.user.may.write(page.page_name) and
+        if not (self.may.isWritable(page) and
+                self.may.write(page.page_name) and
                 self.showBothEditLinks() and
                 self.guiworks(page)):
             return ''
@@ -1239,6 +2471,23 @@ var gui_editor_link_text = "%(text)s";
 
     # RecentChanges ######################################################
 
+    # Row templates, filled once per row by recentchanges_entries
+    recentchanges_entry_template = (
+        '<tr>\n'
+        '<td class="rcicon1">%s</td>\n'
+        '<td class="rcpagelink">%s</td>\n'
+        '<td class="rctime">%s</td>\n'
+        '<td class="rcicon2">%s</td>\n'
+        '<td class="rceditor">%s</td>\n'
+        '<td class="rccomment">%s</td>\n'
+        '</tr>\n')
+
+    recentchanges_daybreak_template = (
+        '<tr class="rcdaybreak"><td colspan="6">'
+        '<strong>%s</strong>'
+        '%s'
+        '</td></tr>\n')
+
     def recentchanges_entry(self, d):
         """
         Assemble a single recentchanges entry (table row)
@@ -1247,41 +2496,47 @@ var gui_editor_link_text = "%(text)s";
         @rtype: string
         @return: recentchanges entry html
         """
-        _ = self.request.getText
-        html = []
-        html.append('<tr>\n')
-        
-        html.append('<td class="rcicon1">%(icon_html)s</td>\n' % d)
-        
-        html.append('<td class="rcpagelink">%(pagelink_html)s</td>\n' % d)
-        
-        html.append('<td class="rctime">')
-        if d['time_html']:
-            html.append("%(time_html)s" % d)
-        html.append('</td>\n')
+        return self.renderRecentchangesEntries([d])
 
-        html.append('<td class="rcicon2">%(info_html)s</td>\n' % d)
-        
-        html.append('<td class="rceditor">')
-        if d['editors']:
-            html.append('<br>'.join(d['editors']))
-        html.append('</td>\n')
-            
-        html.append('<td class="rccomment">')
-        if d['comments']:
-            if d['changecount'] > 1:
-                notfirst = 0
-                for comment in d['comments']:
-                    html.append('%s<tt>#%02d</tt>&nbsp;%s' % (
-                        notfirst and '<br>' or '' , comment[0], comment[1]))
-                    notfirst = 1
+    def recentchanges_entries(self, rows):
+        """
+        Assemble many recentchanges entries (table rows)
+
+        Renders all rows into one buffer using the precompiled row
+        template. Sub classes overriding recentchanges_entry still get
+        their method called for each row.
+
+        @param rows: sequence of recentchanges_entry parameter dicts
+        @rtype: string
+        @return: recentchanges entries html
+        """
+        entry = self.__class__.recentchanges_entry
+        if entry.im_func is not ThemeBase.recentchanges_entry.im_func:
+            return ''.join([self.recentchanges_entry(d) for d in rows])
+        return self.renderRecentchangesEntries(rows)
+
+    def renderRecentchangesEntries(self, rows):
+        """ Render recentchanges entries with the row template
+
+        @param rows: sequence of recentchanges_entry parameter dicts
+        @rtype: string
+        @return: recentchanges entries html
+        """
+        template = self.recentchanges_entry_template
+        html = []
+        append = html.append
+        for d in rows:
+            comments = d['comments']
+            if not comments:
+                comments = ''
+            elif d['changecount'] > 1:
+                comments = '<br>'.join(['<tt>#%02d</tt>&nbsp;%s' % (c[0], c[1])
+                                        for c in comments])
             else:
-                comment = d['comments'][0]
-                html.append('%s' % comment[1])
-        html.append('</td>\n')
-           
-        html.append('</tr>\n')
-        
+                comments = '%s' % comments[0][1]
+            append(template % (d['icon_html'], d['pagelink_html'],
+                               d['time_html'] or '', d['info_html'],
+                               '<br>'.join(d['editors'] or []), comments))
         return ''.join(html)
     
     def recentchanges_daybreak(self, d):
@@ -1296,10 +2551,56 @@ var gui_editor_link_text = "%(text)s";
             set_bm = '&nbsp; %(bookmark_link_html)s' % d
         else:
             set_bm = ''
-        return ('<tr class="rcdaybreak"><td colspan="%d">'
-                '<strong>%s</strong>'
-                '%s'
-                '</td></tr>\n') % (6, d['date'], set_bm)
+        return self.recentchanges_daybreak_template % (d['date'], set_bm)
+
+    def recentchanges_day(self, d, rows, pagenames=None, bookmark=None):
+        """
+        Assemble a rc day block: daybreak and entries
+
+        Blocks of completed days are cached across requests, see
+        RecentChangesDays. Pass pagenames only for completed days; the
+        current day gets new entries and is rendered every time. The
+        rows of a day depend on the pages the user may read, so blocks
+        are shared only between users listing the same pages.
+
+        @param d: recentchanges_daybreak parameter dictionary
+        @param rows: sequence of recentchanges_entry parameter dicts, or
+                     a function returning it, called only when the
+                     block is not cached
+        @param pagenames: names of the pages listed in the block, after
+                          dropping those the user may not read
+        @param bookmark: the user bookmark the rows were made for
+        @rtype: string
+        @return: recentchanges day block html
+        """
+        if pagenames is not None:
+            listed = dict.fromkeys(pagenames).keys()
+            listed.sort()
+            listed = md5(u'\n'.join(listed).encode('utf-8')).hexdigest()
+            key = (d['date'], d['bookmark_link_html'], bookmark, listed,
+                   self.request.lang, getattr(self.request.user, 'tz_offset', 0))
+            days = self.recentchangesDays()
+            html = days.get(key)
+            if html is None:
+                html = self.recentchanges_day(d, rows)
+                days.set(key, html, pagenames)
+            return html
+        if callable(rows):
+            rows = rows()
+        return self.recentchanges_daybreak(d) + self.recentchanges_entries(rows)
+
+    def recentchangesDays(self):
+        """ Return the day block cache of the wiki, see RecentChangesDays
+
+        @rtype: RecentChangesDays
+        @return: cache synced with the edit log
+        """
+        key = (self.name, configKey(self.cfg), self.request.getScriptname())
+        days = _recentchanges_days.get(key)
+        if days is None:
+            days = _recentchanges_days[key] = RecentChangesDays()
+        days.sync(editlogFilename(self.cfg), self.editlogStamp())
+        return days
 
     def recentchanges_header(self, d):
         """
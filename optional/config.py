@@ -20,19 +20,60 @@ charset = 'utf-8'
 
 # Invalid characters - invisible characters that should not be in page
 # names. Prevent user confusion and wiki abuse, e.g u'\u202aFrontPage'.
-page_invalid_chars_regex = re.compile(
-    ur"""
-    \u0000 | # NULL
+page_invalid_chars = (
+    u'\u0000' # NULL
 
     # Bidi control characters
-    \u202A | # LRE
-    \u202B | # RLE
-    \u202C | # PDF
-    \u202D | # LRM
-    \u202E   # RLM
-    """,
-    re.UNICODE | re.VERBOSE
+    u'\u202A' # LRE
+    u'\u202B' # RLE
+    u'\u202C' # PDF
+    u'\u202D' # LRM
+    u'\u202E' # RLM
     )
+page_invalid_chars_regex = re.compile(u'[%s]' % re.escape(page_invalid_chars),
+                                      re.UNICODE)
+
+def invalid_pagenames(names):
+    """ Find the page names containing invalid characters
+
+    Gives the same result as searching each name with
+    page_invalid_chars_regex. The names are joined and each invalid
+    character is looked up with one find scan of the joined text, so
+    valid names cost no Python code at all.
+
+    @param names: sequence of page names (unicode)
+    @rtype: list
+    @return: (index of name, position of its first invalid character)
+             for each invalid name, in order
+    """
+    names = list(names)
+    text = u'\n'.join(names)
+    if text.count(u'\n') != max(len(names) - 1, 0):
+        # Some names contain the separator, check them one by one
+        result = []
+        for index in range(len(names)):
+            match = page_invalid_chars_regex.search(names[index])
+            if match:
+                result.append((index, match.start()))
+        return result
+
+    positions = []
+    for char in page_invalid_chars:
+        position = text.find(char)
+        while position != -1:
+            positions.append(position)
+            position = text.find(char, position + 1)
+    positions.sort()
+
+    result = []
+    index = last = 0
+    for position in positions:
+        index += text.count(u'\n', last, position)
+        last = position
+        if not result or result[-1][0] != index:
+            start = text.rfind(u'\n', 0, position) + 1
+            result.append((index, position - start))
+    return result
 
 # Other stuff
 umask = 0770
@@ -84,6 +125,16 @@ smileys = {
     "{o}":   (15, 15, 0, "star_off.png"),
 }
 
+# Smiley matcher, compiled once: one alternation of all smileys, longest
+# first, so ":))" is found before ":)". Smileys stand between white space
+# or at the ends of the text. Use smiley_pattern to build larger regexes.
+_texts = smileys.keys()
+_texts.sort(key=lambda text: (-len(text), text))
+smiley_pattern = u'|'.join([re.escape(text) for text in _texts])
+smiley_re = re.compile(ur'(?:^|(?<=\s))(%s)(?=\s|$)' % smiley_pattern,
+                       re.UNICODE)
+del _texts
+
 # unicode: set the char types (upper, lower, digits, spaces)
 from MoinMoin.util.chartypes import _chartypes
 for key, val in _chartypes.items():
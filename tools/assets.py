@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+    kaijin - static asset manifest helpers
+
+    The build tools in this directory write their results to
+    manifest.txt in the theme htdocs directory. Each line is a record
+    "kind name value...", with paths relative to the htdocs root (the
+    directory served at url_prefix). ThemeBase reads the manifest once
+    per process when cfg.theme_htdocs_dir is set, and falls back to the
+    raw files for anything the manifest does not list.
+
+    @license: GNU GPL, see COPYING for details.
+"""
+
+import os
+
+try:
+    from hashlib import md5
+except ImportError:
+    from md5 import new as md5
+
+MANIFEST = 'manifest.txt'
+
+
+def fingerprint(data):
+    """ Return a short content hash of data """
+    return md5(data).hexdigest()[:8]
+
+
+def hashedName(path, data):
+    """ Return path with the content hash of data before the extension
+
+    @param path: file path, e.g. kaijin/css/screen.css
+    @param data: file content
+    @rtype: string
+    @return: hashed path, e.g. kaijin/css/screen.0123abcd.css
+    """
+    root, ext = os.path.splitext(path)
+    return '%s.%s%s' % (root, fingerprint(data), ext)
+
+
+def readFile(path):
+    f = open(path, 'rb')
+    try:
+        return f.read()
+    finally:
+        f.close()
+
+
+def writeFile(path, data):
+    """ Write data to path atomically """
+    tmp = path + '.tmp'
+    f = open(tmp, 'wb')
+    try:
+        f.write(data)
+    finally:
+        f.close()
+    if os.name == 'nt' and os.path.exists(path):
+        os.remove(path)
+    os.rename(tmp, path)
+
+
+def readManifest(themedir):
+    """ Return the manifest records of a theme
+
+    @param themedir: theme htdocs directory, e.g. htdocs/kaijin
+    @rtype: list
+    @return: list of records, each a list of fields
+    """
+    path = os.path.join(themedir, MANIFEST)
+    if not os.path.exists(path):
+        return []
+    records = []
+    for line in readFile(path).splitlines():
+        fields = line.split()
+        if fields and not fields[0].startswith('#'):
+            records.append(fields)
+    return records
+
+
+def updateManifest(themedir, kind, records):
+    """ Replace all records of kind in the manifest of a theme
+
+    Records of other kinds, written by other tools, are kept.
+
+    @param themedir: theme htdocs directory
+    @param kind: record kind, e.g. 'bundle'
+    @param records: list of records, each a list of fields after kind
+    @rtype: list
+    @return: the replaced records of kind
+    """
+    old = []
+    lines = ['# Written by the kaijin build tools, do not edit']
+    for fields in readManifest(themedir):
+        if fields[0] == kind:
+            old.append(fields[1:])
+        else:
+            lines.append(' '.join(fields))
+    for fields in records:
+        lines.append(' '.join([kind] + list(fields)))
+    writeFile(os.path.join(themedir, MANIFEST), '\n'.join(lines) + '\n')
+    return old
+
+
+def removeReplaced(themedir, old, current):
+    """ Remove generated files that were replaced by a new build
+
+    @param themedir: theme htdocs directory
+    @param old: paths recorded by the previous build
+    @param current: paths recorded by this build
+    """
+    htdocs = os.path.dirname(os.path.normpath(themedir))
+    for path in old:
+        if path not in current:
+            path = os.path.join(htdocs, *path.split('/'))
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+    kaijin - style sheet bundler
+
+    Resolve the @import chain of the theme style sheets and write one
+    minified, content hashed bundle for each stylesheet mode of
+    ThemeBase: screen (the normal view), print and projection. The
+    bundles are recorded in the theme manifest, which html_stylesheets
+    uses to emit a single link instead of one link per style sheet.
+
+    Usage: python tools/bundlecss.py htdocs/kaijin
+
+    Run it again after changing any style sheet, and after running
+    tools/makesprite.py: the sprite style sheet is included in the
+    bundles.
+
+    @license: GNU GPL, see COPYING for details.
+"""
+
+import os, posixpath, re, sys
+
+from assets import readFile, writeFile, hashedName, readManifest, \
+     updateManifest, removeReplaced
+
+# The stylesheet sets of ThemeBase, keep in sync with
+# ThemeBase.stylesheets, stylesheets_print and stylesheets_projection.
+MODES = {
+    'screen': (('all', 'common'),
+               ('screen', 'screen'),
+               ('print', 'print'),
+               ('projection', 'projection')),
+    'print': (('all', 'common'),
+              ('all', 'print')),
+    'projection': (('all', 'common'),
+                   ('all', 'projection')),
+    }
+
+import_re = re.compile(r"""@import\s+(?:url\(\s*)?["']?([^"')\s]+)["']?\s*\)?\s*([^;]*);""")
+url_re = re.compile(r"""url\(\s*["']?([^"')]+?)["']?\s*\)""")
+
+# Strings are matched first, so nothing inside them is changed
+string = r""""(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*'"""
+space_re = re.compile(r'(%s)|/\*.*?\*/|\s+' % string, re.S)
+punctuation_re = re.compile(r'(%s)|\s*([{};,])\s*|(:)\s+' % string)
+
+
+def resolve(cssdir, name, seen=()):
+    """ Return a style sheet with its @imports replaced by their content
+
+    url() references in imported style sheets are rewritten relative to
+    cssdir, where the bundle is written.
+
+    @param cssdir: directory of the bundle
+    @param name: style sheet path, relative to cssdir
+    @param seen: style sheets being resolved, to stop import loops
+    @rtype: string
+    @return: style sheet without @import rules
+    """
+    if name in seen:
+        return ''
+    css = readFile(os.path.join(cssdir, name))
+    base = posixpath.dirname(name)
+
+    def rebase(match):
+        url = match.group(1)
+        if not base or ':' in url or url.startswith('/'):
+            return match.group(0)
+        return 'url(%s)' % posixpath.normpath(posixpath.join(base, url))
+
+    def inline(match):
+        imported = posixpath.normpath(posixpath.join(base, match.group(1)))
+        content = resolve(cssdir, imported, seen + (name,))
+        media = match.group(2).strip()
+        if media and media != 'all':
+            content = '@media %s {\n%s\n}' % (media, content)
+        return content
+
+    if base:
+        css = url_re.sub(rebase, css)
+    return import_re.sub(inline, css)
+
+
+def minify(css):
+    """ Remove comments and needless white space from a style sheet """
+    def space(match):
+        return match.group(1) or (match.group(0).startswith('/*') and '' or ' ')
+
+    def punctuation(match):
+        return match.group(1) or match.group(2) or match.group(3)
+
+    css = space_re.sub(space, css)
+    css = punctuation_re.sub(punctuation, css)
+    return css.replace(';}', '}').strip() + '\n'
+
+
+def bundle(cssdir, stylesheets, extra=()):
+    """ Return the bundle of a stylesheet set
+
+    @param cssdir: style sheet directory
+    @param stylesheets: sequence of (media, basename)
+    @param extra: names of more style sheets for all media
+    @rtype: string
+    @return: minified style sheet
+    """
+    parts = []
+    for media, basename in stylesheets:
+        css = resolve(cssdir, basename + '.css')
+        if media != 'all':
+            css = '@media %s {\n%s\n}' % (media, css)
+        parts.append(css)
+    for name in extra:
+        parts.append(resolve(cssdir, name))
+    return minify('\n'.join(parts))
+
+
+def main(themedir):
+    themedir = os.path.normpath(themedir)
+    theme = os.path.basename(themedir)
+    cssdir = os.path.join(themedir, 'css')
+
+    # Include the sprite style sheet, and record it, so the theme knows
+    # it does not have to link it separately.
+    sprites = []
+    for fields in readManifest(themedir):
+        if fields[:2] == ['spritesheet', 'css']:
+            sprites = [fields[2]]
+
+    records = []
+    for mode, stylesheets in MODES.items():
+        css = bundle(cssdir, stylesheets,
+                     [posixpath.basename(path) for path in sprites])
+        path = hashedName('%s/css/bundle-%s.css' % (theme, mode), css)
+        writeFile(os.path.join(themedir, 'css', posixpath.basename(path)), css)
+        records.append([mode, path] + sprites)
+        print '%s: %s (%d bytes)' % (mode, path, len(css))
+    records.sort()
+
+    old = updateManifest(themedir, 'bundle', records)
+    removeReplaced(themedir, [fields[1] for fields in old],
+                   [fields[1] for fields in records])
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print __doc__
+        sys.exit(1)
+    main(sys.argv[1])
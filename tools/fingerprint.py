@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+    kaijin - static asset fingerprinting
+
+    Copy the static assets used by the theme to names containing their
+    content hash and record them in the theme manifest: the style
+    sheets and images of the theme, its scripts and the MoinMoin common
+    scripts in htdocs/common/js. The theme links the hashed copies, so
+    the web server can serve them with far future, immutable cache
+    headers: a changed file gets a new name.
+
+    References between style sheets and to images (@import and url())
+    are rewritten to the hashed copies, so a change to an image or an
+    imported style sheet changes the name of the style sheets using it.
+    The style sheet bundles of tools/bundlecss.py are rewritten the same
+    way, and renamed by the hash of the rewritten content.
+
+    Usage: python tools/fingerprint.py htdocs/kaijin
+
+    Run it again after changing any asset, and after the other tools.
+
+    @license: GNU GPL, see COPYING for details.
+"""
+
+import os, posixpath, re, sys
+
+from assets import readFile, writeFile, hashedName, readManifest, \
+     updateManifest, removeReplaced
+
+# Hashed copies and bundles, name.0123abcd.ext, are hashed already
+hashed_re = re.compile(r'\.[0-9a-f]{8}\.[^.]+$')
+
+# (directory below htdocs, file extension); %s is the theme name
+SOURCES = (
+    ('%s/img', '.png'),
+    ('%s/css', '.css'),
+    ('%s/js', '.js'),
+    ('common/js', '.js'),
+    )
+
+reference_re = re.compile(
+    r"""(@import\s+(?:url\(\s*)?|url\(\s*)(["']?)([^"')\s]+)(["']?)""")
+
+
+def assets(htdocs, theme):
+    """ Return the paths of the assets to fingerprint
+
+    @param htdocs: htdocs root directory
+    @param theme: theme name
+    @rtype: list
+    @return: paths relative to htdocs, images first
+    """
+    paths = []
+    for directory, ext in SOURCES:
+        directory = directory.replace('%s', theme)
+        path = os.path.join(htdocs, *directory.split('/'))
+        if not os.path.isdir(path):
+            continue
+        names = [name for name in os.listdir(path)
+                 if name.endswith(ext) and not hashed_re.search(name)]
+        names.sort()
+        paths.extend(['%s/%s' % (directory, name) for name in names])
+    return paths
+
+
+def rewriteReferences(htdocs, path, data, hashed, paths):
+    """ Return a style sheet referencing the hashed copies of the assets
+
+    The referenced assets are fingerprinted first.
+
+    @param htdocs: htdocs root directory
+    @param path: style sheet path
+    @param data: style sheet content
+    @param hashed: dict of path -> hashed path, updated
+    @param paths: all asset paths
+    @rtype: string
+    @return: style sheet content
+    """
+    base = posixpath.dirname(path)
+
+    def rewrite(match):
+        url = match.group(3)
+        target = posixpath.normpath(posixpath.join(base, url))
+        if ':' in url or url.startswith('/') or target not in paths:
+            return match.group(0)
+        target = fingerprint(htdocs, target, hashed, paths)
+        url = posixpath.join(posixpath.dirname(url),
+                             posixpath.basename(target))
+        return match.group(1) + match.group(2) + url + match.group(4)
+
+    return reference_re.sub(rewrite, data)
+
+
+def fingerprint(htdocs, path, hashed, paths):
+    """ Write the hashed copy of an asset
+
+    Style sheets are written after the assets they reference, with the
+    references rewritten to the hashed copies.
+
+    @param htdocs: htdocs root directory
+    @param path: asset path
+    @param hashed: dict of path -> hashed path, updated
+    @param paths: all asset paths
+    @rtype: string
+    @return: hashed path
+    """
+    if path in hashed:
+        return hashed[path]
+    hashed[path] = path # stop import loops
+    data = readFile(os.path.join(htdocs, *path.split('/')))
+    if path.endswith('.css'):
+        data = rewriteReferences(htdocs, path, data, hashed, paths)
+    hashed[path] = hashedName(path, data)
+    writeFile(os.path.join(htdocs, *hashed[path].split('/')), data)
+    return hashed[path]
+
+
+def fingerprintBundle(htdocs, path, hashed, paths):
+    """ Rewrite the references of a style sheet bundle
+
+    Bundles are hashed by tools/bundlecss.py before their images are,
+    so they are hashed again after the rewrite. Rewriting a bundle
+    twice changes nothing.
+
+    @param htdocs: htdocs root directory
+    @param path: hashed bundle path
+    @param hashed: dict of path -> hashed path, updated
+    @param paths: all asset paths
+    @rtype: string
+    @return: new hashed bundle path
+    """
+    data = readFile(os.path.join(htdocs, *path.split('/')))
+    data = rewriteReferences(htdocs, path, data, hashed, paths)
+    ext = posixpath.splitext(path)[1]
+    rehashed = hashedName(hashed_re.sub(ext, path), data)
+    if rehashed != path:
+        writeFile(os.path.join(htdocs, *rehashed.split('/')), data)
+    return rehashed
+
+
+def main(themedir):
+    themedir = os.path.normpath(themedir)
+    htdocs = os.path.dirname(themedir)
+    paths = assets(htdocs, os.path.basename(themedir))
+    hashed = {}
+    records = []
+    for path in paths:
+        records.append((path, fingerprint(htdocs, path, hashed, paths)))
+        print '%s -> %s' % records[-1]
+
+    old = updateManifest(themedir, 'asset', records)
+    removeReplaced(themedir, [fields[1] for fields in old],
+                   [path for name, path in records])
+
+    # Hash the bundles last, after the images they reference
+    bundles = [fields[1:] for fields in readManifest(themedir)
+               if fields[0] == 'bundle']
+    for fields in bundles:
+        fields[1] = fingerprintBundle(htdocs, fields[1], hashed, paths)
+        print 'bundle %s -> %s' % (fields[0], fields[1])
+    if bundles:
+        old = updateManifest(themedir, 'bundle', bundles)
+        removeReplaced(themedir, [fields[1] for fields in old],
+                       [fields[1] for fields in bundles])
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print __doc__
+        sys.exit(1)
+    main(sys.argv[1])
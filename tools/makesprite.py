@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+    kaijin - icon sprite generator
+
+    Pack the icons of ThemeBase.icons and the smileys of config.smileys
+    into one image, and write a style sheet mapping each icon to its
+    offset in the image. Both are recorded in the theme manifest;
+    make_icon then emits a sized element showing the sprite instead of
+    an <img> per icon, so a page needs a single image request.
+
+    An <img> shows an icon at the width and height of the icons table,
+    which is not always the size of the file. So each icon is packed
+    scaled to the sizes it is shown at, and gets one css class per size.
+
+    Usage: python tools/makesprite.py htdocs/kaijin
+
+    Needs MoinMoin (with the theme package of this theme) and the
+    Python Imaging Library. Run tools/bundlecss.py afterwards to include
+    the sprite style sheet in the bundles.
+
+    @license: GNU GPL, see COPYING for details.
+"""
+
+import os, posixpath, re, sys
+from StringIO import StringIO
+
+try:
+    from PIL import Image
+except ImportError:
+    import Image
+
+from assets import writeFile, hashedName, updateManifest, removeReplaced
+
+# Space between icons, so scaled or rounded offsets never show a
+# neighbour
+GAP = 2
+
+
+def spriteClass(filename, w, h):
+    """ Return the css class of an icon file shown at w x h """
+    name = os.path.splitext(filename)[0]
+    return 'sprite-%s-%dx%d' % (re.sub(r'[^a-zA-Z0-9_-]', '-', name), w, h)
+
+
+def spriteName(filename, w, h):
+    """ Return the manifest name of an icon, see ThemeBase.get_sprite """
+    return '%s@%dx%d' % (filename, w, h)
+
+
+def iconSizes():
+    """ Return the sizes the theme icons and smileys are shown at
+
+    @rtype: list
+    @return: (filename, w, h) for each size a file is shown at
+    """
+    from MoinMoin.theme import ThemeBase
+    from MoinMoin import config
+    sizes = {}
+    for alt, filename, w, h in ThemeBase.icons.values():
+        sizes[(filename, w, h)] = 1
+    for w, h, border, filename in config.smileys.values():
+        sizes[(filename, w, h)] = 1
+    sizes = sizes.keys()
+    sizes.sort()
+    return sizes
+
+
+def pack(imgdir, sizes):
+    """ Stack the icons vertically into one image
+
+    Icons are scaled to the size they are shown at, as browsers scale
+    an <img> to its width and height.
+
+    @param imgdir: icon directory
+    @param sizes: list of (filename, w, h)
+    @rtype: tuple
+    @return: sprite image, list of (filename, x, y, w, h)
+    """
+    icons = []
+    for name, w, h in sizes:
+        path = os.path.join(imgdir, name)
+        if not os.path.exists(path):
+            print 'skipping missing icon %s' % name
+            continue
+        icon = Image.open(path).convert('RGBA')
+        if icon.size != (w, h):
+            icon = icon.resize((w, h), Image.ANTIALIAS)
+        icons.append((name, icon))
+    width = max([icon.size[0] for name, icon in icons])
+    height = sum([icon.size[1] + GAP for name, icon in icons]) - GAP
+    sheet = Image.new('RGBA', (width, height), (0, 0, 0, 0))
+    positions = []
+    y = 0
+    for name, icon in icons:
+        w, h = icon.size
+        sheet.paste(icon, (0, y))
+        positions.append((name, 0, y, w, h))
+        y += h + GAP
+    return sheet, positions
+
+
+def stylesheet(image, positions):
+    """ Return the style sheet mapping icon classes to sprite offsets """
+    rules = ['.sprite { display: inline-block; overflow: hidden; '
+             'text-indent: -9999px; vertical-align: middle; '
+             'background: url(../img/%s) no-repeat; }' % image]
+    for name, x, y, w, h in positions:
+        rules.append('.%s { background-position: -%dpx -%dpx; '
+                     'width: %dpx; height: %dpx; }'
+                     % (spriteClass(name, w, h), x, y, w, h))
+    return '\n'.join(rules) + '\n'
+
+
+def main(themedir):
+    themedir = os.path.normpath(themedir)
+    theme = os.path.basename(themedir)
+    sheet, positions = pack(os.path.join(themedir, 'img'), iconSizes())
+
+    buf = StringIO()
+    sheet.save(buf, 'PNG', optimize=1)
+    image = hashedName('%s/img/sprite.png' % theme, buf.getvalue())
+    writeFile(os.path.join(themedir, 'img', posixpath.basename(image)),
+              buf.getvalue())
+
+    css = stylesheet(posixpath.basename(image), positions)
+    csspath = hashedName('%s/css/sprite.css' % theme, css)
+    writeFile(os.path.join(themedir, 'css', posixpath.basename(csspath)), css)
+
+    records = [(spriteName(name, w, h), spriteClass(name, w, h),
+                str(x), str(y), str(w), str(h))
+               for name, x, y, w, h in positions]
+    updateManifest(themedir, 'sprite', records)
+    sheets = [('css', csspath), ('image', image)]
+    old = updateManifest(themedir, 'spritesheet', sheets)
+    removeReplaced(themedir, [fields[1] for fields in old], [csspath, image])
+    print '%d icons: %s, %s' % (len(positions), image, csspath)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print __doc__
+        sys.exit(1)
+    main(sys.argv[1])